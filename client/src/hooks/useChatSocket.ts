@@ -19,6 +19,15 @@ export interface Message {
   attachments?: Attachment[];
 }
 
+const PAGE_SIZE = 50;
+
+const toMessage = (m: any): Message => ({
+  id: m._id || m.id,
+  role: m.role,
+  content: m.content,
+  attachments: m.attachments || [],
+});
+
 export const useChatSocket = (chatId: string | undefined) => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [status, setStatus] = useState<string | null>(null);
@@ -28,6 +37,8 @@ export const useChatSocket = (chatId: string | undefined) => {
   const [isStreaming, setIsStreaming] = useState(false);
   const [isConnecting, setIsConnecting] = useState(false);
   const [connectionKey, setConnectionKey] = useState(0);
+  const [olderCursor, setOlderCursor] = useState<string | null>(null);
+  const [isLoadingOlder, setIsLoadingOlder] = useState(false);
   const pendingMessage = useRef<{ content: string; attachment: any } | null>(
     null
   );
@@ -40,16 +51,14 @@ export const useChatSocket = (chatId: string | undefined) => {
     if (pendingMessage.current) return;
 
     setIsConnecting(true);
+    setOlderCursor(null);
     api
-      .get(`/api/chat/sessions/${chatId}/messages`)
+      .get(`/api/chat/sessions/${chatId}/messages`, {
+        params: { limit: PAGE_SIZE },
+      })
       .then((res) => {
-        const formatted = res.data.map((m: any) => ({
-          id: m._id || m.id,
-          role: m.role,
-          content: m.content,
-          attachments: m.attachments || [],
-        }));
-        setMessages(formatted);
+        setMessages(res.data.map(toMessage));
+        setOlderCursor(res.headers["x-next-cursor"] ?? null);
       })
       .catch((err) => {
         if (err.response?.status === 404) {
@@ -66,8 +75,37 @@ export const useChatSocket = (chatId: string | undefined) => {
     if (!token || !chatId) return;
     if (socketRef.current) socketRef.current.close();
 
-    const url = getSocketUrl(`/api/chat/ws/${chatId}?token=${token}`);
+    const url = getSocketUrl(
+      `/api/chat/ws/${chatId}?token=${token}&compact=true`
+    );
     const ws = new WebSocket(url);
+    ws.binaryType = "arraybuffer";
+    const decoder = new TextDecoder();
+
+    // Streamed text is appended at most once per animation frame instead of once per socket frame.
+    let pendingText = "";
+    let frameHandle: number | null = null;
+    const flushText = () => {
+      frameHandle = null;
+      if (!pendingText) return;
+      const text = pendingText;
+      pendingText = "";
+      setMessages((prev) => {
+        const lastMsg = prev[prev.length - 1];
+        if (!lastMsg || lastMsg.role !== "assistant") return prev;
+        const newArr = prev.slice();
+        newArr[newArr.length - 1] = {
+          ...lastMsg,
+          content: lastMsg.content + text,
+        };
+        return newArr;
+      });
+    };
+    const appendText = (text: string) => {
+      pendingText += text;
+      if (frameHandle === null)
+        frameHandle = requestAnimationFrame(flushText);
+    };
 
     ws.onopen = () => {
       if (pendingMessage.current) {
@@ -83,7 +121,16 @@ export const useChatSocket = (chatId: string | undefined) => {
     };
 
     ws.onmessage = (event) => {
+      if (event.data instanceof ArrayBuffer) {
+        setStatus(null);
+        appendText(decoder.decode(event.data));
+        return;
+      }
       const data = JSON.parse(event.data);
+      if (data.type !== "chunk" && frameHandle !== null) {
+        cancelAnimationFrame(frameHandle);
+        flushText();
+      }
       if (data.type === "start") {
         setIsStreaming(true);
         setStatus(null);
@@ -93,15 +140,34 @@ export const useChatSocket = (chatId: string | undefined) => {
         ]);
       } else if (data.type === "status") {
         setStatus(data.content);
-      } else if (data.type === "chunk") {
-        setStatus(null);
+      } else if (data.type === "discard") {
+        // A provider failed mid-reply; the backup's answer replaces what was shown.
+        pendingText = "";
         setMessages((prev) => {
-          const newArr = [...prev];
-          const lastMsg = newArr[newArr.length - 1];
-          if (lastMsg && lastMsg.role === "assistant")
-            lastMsg.content += data.content;
+          const lastMsg = prev[prev.length - 1];
+          if (!lastMsg || lastMsg.role !== "assistant") return prev;
+          const newArr = prev.slice();
+          newArr[newArr.length - 1] = { ...lastMsg, content: "" };
           return newArr;
         });
+      } else if (data.type === "image_pending") {
+        // The turn ends now; the picture arrives later as an "image" frame for this message id.
+        setMessages((prev) => {
+          const lastMsg = prev[prev.length - 1];
+          if (!lastMsg || lastMsg.role !== "assistant") return prev;
+          const newArr = prev.slice();
+          newArr[newArr.length - 1] = { ...lastMsg, id: data.id, content: data.content };
+          return newArr;
+        });
+      } else if (data.type === "image") {
+        setMessages((prev) =>
+          prev.map((m) => (m.id === data.id ? { ...m, content: data.content } : m))
+        );
+      } else if (data.type === "ingest_progress") {
+        setStatus(`Indexing ${data.filename} (${data.chunks} sections)...`);
+      } else if (data.type === "chunk") {
+        setStatus(null);
+        appendText(data.content);
       } else if (data.type === "end") {
         setIsStreaming(false);
         setStatus(null);
@@ -122,7 +188,10 @@ export const useChatSocket = (chatId: string | undefined) => {
     };
 
     socketRef.current = ws;
-    return () => ws.close();
+    return () => {
+      if (frameHandle !== null) cancelAnimationFrame(frameHandle);
+      ws.close();
+    };
   }, [token, chatId, connectionKey]);
 
   const sendMessage = useCallback(
@@ -197,11 +266,32 @@ export const useChatSocket = (chatId: string | undefined) => {
     socketRef.current.send(JSON.stringify({ type: "regenerate" }));
   }, []);
 
+  const loadOlder = useCallback(async () => {
+    if (!chatId || !olderCursor || isLoadingOlder) return;
+    setIsLoadingOlder(true);
+    try {
+      const res = await api.get(`/api/chat/sessions/${chatId}/messages`, {
+        params: { limit: PAGE_SIZE, before: olderCursor },
+      });
+      setMessages((prev) => [...res.data.map(toMessage), ...prev]);
+      setOlderCursor(res.headers["x-next-cursor"] ?? null);
+    } catch {
+      toast.error("Failed to load earlier messages");
+    } finally {
+      setIsLoadingOlder(false);
+    }
+  }, [chatId, olderCursor, isLoadingOlder]);
+
   const stopGeneration = useCallback(() => {
-    if (socketRef.current) {
-      socketRef.current.close();
-      setIsStreaming(false);
-      setStatus(null);
+    const ws = socketRef.current;
+    if (!ws) return;
+    setIsStreaming(false);
+    setStatus(null);
+    if (ws.readyState === WebSocket.OPEN) {
+      // The server aborts the provider stream and keeps what was already shown.
+      ws.send(JSON.stringify({ type: "cancel" }));
+    } else {
+      ws.close();
       setConnectionKey((prev) => prev + 1);
     }
   }, []);
@@ -212,6 +302,9 @@ export const useChatSocket = (chatId: string | undefined) => {
     editMessage,
     regenerateResponse,
     stopGeneration,
+    loadOlder,
+    hasOlder: olderCursor !== null,
+    isLoadingOlder,
     isStreaming,
     isConnecting,
     status,
@@ -1,6 +1,6 @@
 /* eslint-disable @typescript-eslint/no-explicit-any */
 /* eslint-disable react-hooks/exhaustive-deps */
-import { useState, useEffect, useRef } from "react";
+import { useState, useEffect, useLayoutEffect, useRef } from "react";
 import { useNavigate, useParams } from "react-router-dom";
 import { Button } from "@/components/ui/button";
 import { ScrollArea } from "@/components/ui/scroll-area";
@@ -27,6 +27,9 @@ const Chat = () => {
     editMessage,
     regenerateResponse,
     stopGeneration,
+    loadOlder,
+    hasOlder,
+    isLoadingOlder,
     isStreaming,
     isConnecting,
     status,
@@ -36,6 +39,8 @@ const Chat = () => {
   const [showScrollButton, setShowScrollButton] = useState(false);
   const scrollViewportRef = useRef<HTMLDivElement>(null);
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  // Scroll height before an older page is prepended, so the view can stay where it was.
+  const heightBeforeLoad = useRef<number | null>(null);
 
   useEffect(() => {
     const handleResize = () => {
@@ -58,6 +63,13 @@ const Chat = () => {
     return () => document.removeEventListener("mousedown", handleClickOutside);
   }, []);
 
+  useLayoutEffect(() => {
+    const viewport = scrollViewportRef.current;
+    if (heightBeforeLoad.current === null || !viewport || isLoadingOlder) return;
+    viewport.scrollTop += viewport.scrollHeight - heightBeforeLoad.current;
+    heightBeforeLoad.current = null;
+  }, [messages, isLoadingOlder]);
+
   useEffect(() => {
     if (autoScroll && messagesEndRef.current) {
       messagesEndRef.current.scrollIntoView({ behavior: "smooth" });
@@ -77,6 +89,10 @@ const Chat = () => {
       target.scrollHeight - target.scrollTop - target.clientHeight < 100;
     setShowScrollButton(!isNearBottom);
     setAutoScroll(isNearBottom);
+    if (target.scrollTop < 200 && hasOlder && !isLoadingOlder) {
+      heightBeforeLoad.current = target.scrollHeight;
+      loadOlder();
+    }
   };
 
   const handleSendMessage = async (content: string, attachment?: any) => {
@@ -195,6 +211,9 @@ const Chat = () => {
                 viewportRef={scrollViewportRef}
               >
                 <div className="w-full max-w-3xl mx-auto px-4 py-8 pb-40 flex flex-col gap-2">
+                  {isLoadingOlder && (
+                    <Skeleton className="h-3 w-32 mx-auto rounded-full bg-muted/50" />
+                  )}
                   {messages.map((m, i) => (
                     <ChatMessage
                       key={m.id || i}
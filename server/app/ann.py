@@ -0,0 +1,157 @@
+import numpy as np
+from typing import Optional, Tuple
+
+def _sq_dists(x: np.ndarray, centroids: np.ndarray, c_norms: Optional[np.ndarray] = None) -> np.ndarray:
+    if c_norms is None:
+        c_norms = (centroids ** 2).sum(axis=1)
+    return (x ** 2).sum(axis=1, keepdims=True) - 2.0 * x @ centroids.T + c_norms
+
+def _assign(x: np.ndarray, centroids: np.ndarray, block: int = 16384) -> np.ndarray:
+    c_norms = (centroids ** 2).sum(axis=1)
+    out = np.empty(len(x), dtype=np.int64)
+    for i in range(0, len(x), block):
+        out[i:i + block] = _sq_dists(x[i:i + block], centroids, c_norms).argmin(axis=1)
+    return out
+
+def kmeans(x: np.ndarray, k: int, iters: int = 15, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centroids = x[rng.choice(len(x), size=k, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(x, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        empty = counts == 0
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.add.reduceat(x[order], starts[~empty], axis=0)
+        centroids[~empty] = sums / counts[~empty, None]
+        # Re-seed dead clusters on random points so every list stays useful.
+        if empty.any():
+            centroids[empty] = x[rng.choice(len(x), size=int(empty.sum()), replace=False)]
+    return centroids
+
+class IVFPQIndex:
+    """Inverted-file index with product-quantised residuals (IVF-PQ) over NumPy arrays.
+
+    Knobs: `nlist` coarse cells, `m` sub-quantisers of 2**`nbits` centroids (memory is `m`
+    bytes per vector) and, at query time, `nprobe` cells to scan -- more cells, more recall,
+    more latency. Vectors are expected L2-normalised so squared L2 ranks like cosine.
+    """
+
+    def __init__(self, dim: int, nlist: int = 256, m: int = 48, nbits: int = 8, nprobe: int = 16):
+        if dim % m:
+            raise ValueError(f"dim {dim} is not divisible by m={m}")
+        self.dim, self.nlist, self.m, self.nbits, self.nprobe = dim, nlist, m, nbits, nprobe
+        self.ksub = 2 ** nbits
+        self.dsub = dim // m
+        self.coarse: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+        self.list_codes = [np.empty((0, m), dtype=np.uint8) for _ in range(nlist)]
+        self.list_ids = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self.list_sizes = np.zeros(nlist, dtype=np.int64)
+        self.ntotal = 0
+
+    @property
+    def is_trained(self) -> bool:
+        return self.coarse is not None
+
+    def _prepare(self):
+        self._coarse_norms = (self.coarse ** 2).sum(axis=1)
+        self._codebook_norms = (self.codebooks ** 2).sum(axis=2)
+
+    def train(self, x: np.ndarray, max_points: int = 65536, seed: int = 0):
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) < max(self.nlist, self.ksub):
+            raise ValueError(f"need at least {max(self.nlist, self.ksub)} vectors to train, got {len(x)}")
+        if len(x) > max_points:
+            x = x[np.random.default_rng(seed).choice(len(x), size=max_points, replace=False)]
+        self.coarse = kmeans(x, self.nlist, seed=seed)
+        residuals = x - self.coarse[_assign(x, self.coarse)]
+        self.codebooks = np.stack([
+            kmeans(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.ksub, iters=10, seed=seed + j)
+            for j in range(self.m)
+        ])
+        self._prepare()
+
+    def _encode(self, residuals: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(residuals), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            codes[:, j] = _assign(residuals[:, j * self.dsub:(j + 1) * self.dsub], self.codebooks[j])
+        return codes
+
+    def add(self, x: np.ndarray, ids: np.ndarray):
+        x = np.asarray(x, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+        lists = _assign(x, self.coarse)
+        codes = self._encode(x - self.coarse[lists])
+        for cell in np.unique(lists):
+            sel = lists == cell
+            self._append(int(cell), codes[sel], ids[sel])
+        self.ntotal += len(x)
+
+    def _append(self, cell: int, codes: np.ndarray, ids: np.ndarray):
+        # Geometric growth keeps a stream of single-chunk inserts amortised O(1).
+        size, needed = self.list_sizes[cell], self.list_sizes[cell] + len(ids)
+        if needed > len(self.list_ids[cell]):
+            capacity = max(needed, 2 * len(self.list_ids[cell]), 16)
+            grown_codes = np.empty((capacity, self.m), dtype=np.uint8)
+            grown_ids = np.empty(capacity, dtype=np.int64)
+            grown_codes[:size] = self.list_codes[cell][:size]
+            grown_ids[:size] = self.list_ids[cell][:size]
+            self.list_codes[cell], self.list_ids[cell] = grown_codes, grown_ids
+        self.list_codes[cell][size:needed] = codes
+        self.list_ids[cell][size:needed] = ids
+        self.list_sizes[cell] = needed
+
+    def search(self, query: np.ndarray, k: int, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        q = np.asarray(query, dtype=np.float32).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        coarse_d = self._coarse_norms - 2.0 * (self.coarse @ q)
+        cells = np.argpartition(coarse_d, nprobe - 1)[:nprobe]
+
+        cells = cells[self.list_sizes[cells] > 0]
+        if not len(cells):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        # Asymmetric distance tables for every probed cell at once, (nprobe, m, ksub), expanded as
+        # |r|^2 - 2<r, p> + |p|^2 so the bulk is one batched matmul.
+        residuals = (q - self.coarse[cells]).reshape(len(cells), self.m, self.dsub).transpose(1, 0, 2)
+        tables = (self._codebook_norms[:, None, :] - 2.0 * residuals @ self.codebooks.transpose(0, 2, 1)).transpose(1, 0, 2)
+        tables += (residuals ** 2).sum(axis=2).T[:, :, None]
+        sizes = self.list_sizes[cells]
+        codes = np.concatenate([self.list_codes[c][:n] for c, n in zip(cells, sizes)])
+        rows = np.repeat(np.arange(len(cells)), sizes)
+        dists = tables[rows[:, None], np.arange(self.m), codes].sum(axis=1)
+        ids = np.concatenate([self.list_ids[c][:n] for c, n in zip(cells, sizes)])
+
+        k = min(k, len(ids))
+        top = np.argpartition(dists, k - 1)[:k]
+        top = top[np.argsort(dists[top])]
+        return ids[top], dists[top]
+
+    def to_arrays(self) -> dict:
+        lists = np.repeat(np.arange(self.nlist), self.list_sizes)
+        return dict(
+            params=np.array([self.dim, self.nlist, self.m, self.nbits, self.nprobe]),
+            coarse=self.coarse,
+            codebooks=self.codebooks,
+            lists=lists,
+            codes=np.concatenate([c[:n] for c, n in zip(self.list_codes, self.list_sizes)]),
+            ids=np.concatenate([i[:n] for i, n in zip(self.list_ids, self.list_sizes)]),
+        )
+
+    def save(self, path: str):
+        np.savez(path, **self.to_arrays())
+
+    @classmethod
+    def load(cls, path: str) -> "IVFPQIndex":
+        with np.load(path) as data:
+            dim, nlist, m, nbits, nprobe = (int(v) for v in data["params"])
+            index = cls(dim, nlist=nlist, m=m, nbits=nbits, nprobe=nprobe)
+            index.coarse, index.codebooks = data["coarse"], data["codebooks"]
+            lists, codes, ids = data["lists"], data["codes"], data["ids"]
+        index._prepare()
+        for cell in np.unique(lists):
+            sel = lists == cell
+            index._append(int(cell), codes[sel], ids[sel])
+        index.ntotal = len(ids)
+        return index
@@ -1,20 +1,36 @@
 from datetime import datetime, timedelta
 import random
 import os
+import time
+import secrets
 import httpx
 from fastapi import APIRouter, HTTPException, Depends, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import HTTPBearer, OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import jwt, JWTError
 from pydantic import BaseModel, EmailStr
 from .models import User
 from .email_service import send_otp_email
+from .cache import TTLCache
+from .executors import threads
 
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback_secret")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 
+AUTH_USER_CACHE_TTL = float(os.getenv("AUTH_USER_CACHE_TTL", 60))
+AUTH_TOKEN_CACHE_TTL = float(os.getenv("AUTH_TOKEN_CACHE_TTL", 3600))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+
+# Decoded tokens (token -> email) live until the earlier of their own expiry and AUTH_TOKEN_CACHE_TTL;
+# users are cached briefly and dropped explicitly whenever this module changes one.
+token_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_TOKEN_CACHE_TTL)
+user_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_USER_CACHE_TTL)
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+# Bearer secret for the operational endpoints (/stats, /metrics, /traces, /debug/loop); they are off when it is unset.
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+admin_scheme = HTTPBearer(auto_error=False)
 router = APIRouter()
 
 # --- SCHEMAS ---
@@ -46,11 +62,11 @@ class ResetPasswordConfirm(BaseModel):
     new_password: str
 
 # --- HELPERS ---
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    return await threads.run(pwd_context.hash, password)
 
-def verify_password(plain, hashed):
-    return pwd_context.verify(plain, hashed)
+async def verify_password(plain, hashed):
+    return await threads.run(pwd_context.verify, plain, hashed)
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7
 
@@ -63,28 +79,54 @@ def create_access_token(data: dict):
 def generate_otp():
     return str(random.randint(100000, 999999))
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def decode_token(token: str):
+    """The token's subject email, or None if it is invalid or expired."""
+    email = token_cache.get(token)
+    if email is not None:
+        return email
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        if email is None: raise HTTPException(status_code=401)
     except JWTError:
-        raise HTTPException(status_code=401)
+        return None
+    email = payload.get("sub")
+    if email is None:
+        return None
+    ttl = AUTH_TOKEN_CACHE_TTL
+    if payload.get("exp"):
+        # `exp` is epoch seconds; time.time() is too, whatever the host's timezone.
+        ttl = min(ttl, payload["exp"] - time.time())
+    if ttl > 0:
+        token_cache.set(token, email, ttl=ttl)
+    return email
+
+async def load_user(email: str):
+    return await user_cache.get_or_compute(
+        email, lambda: User.find_one(User.email == email), cacheable=lambda user: user is not None
+    )
+
+def invalidate_user(email: str):
+    user_cache.pop(email)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)):
+    email = decode_token(token)
+    if email is None: raise HTTPException(status_code=401)
     
-    user = await User.find_one(User.email == email)
+    user = await load_user(email)
     if not user: raise HTTPException(status_code=401)
     if not user.is_verified: raise HTTPException(status_code=403)
     return user
 
+async def require_admin(credentials = Depends(admin_scheme)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404)
+    if credentials is None or not secrets.compare_digest(credentials.credentials, ADMIN_TOKEN):
+        raise HTTPException(status_code=401)
+
 async def get_ws_user(token: str):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email = payload.get("sub")
-        if email is None: return None
-    except JWTError:
-        return None
+    email = decode_token(token)
+    if email is None: return None
     
-    user = await User.find_one(User.email == email)
+    user = await load_user(email)
     if user and not user.is_verified: return None
     return user
 
@@ -98,7 +140,7 @@ async def register(user_data: UserRegister):
     otp = generate_otp()
     new_user = User(
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await get_password_hash(user_data.password),
         first_name=user_data.first_name,
         last_name=user_data.last_name,
         is_verified=False,
@@ -126,6 +168,7 @@ async def verify_email(data: VerifyOTP):
     user.is_verified = True
     user.otp_code = None
     await user.save()
+    invalidate_user(user.email)
     
     token = create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
@@ -133,7 +176,7 @@ async def verify_email(data: VerifyOTP):
 @router.post("/login", tags=["Authentication"])
 async def login(data: LoginRequest):
     user = await User.find_one(User.email == data.email)
-    if not user or not verify_password(data.password, user.hashed_password):
+    if not user or not await verify_password(data.password, user.hashed_password):
         raise HTTPException(400, "Invalid credentials")
     
     if not user.is_verified:
@@ -150,6 +193,7 @@ async def forgot_password(data: ResetPasswordRequest):
         user.otp_code = otp
         user.otp_expires_at = datetime.utcnow() + timedelta(minutes=10)
         await user.save()
+        invalidate_user(user.email)
         try:
             await send_otp_email(data.email, otp)
         except:
@@ -162,9 +206,10 @@ async def reset_password_confirm(data: ResetPasswordConfirm):
     if not user or user.otp_code != data.otp:
         raise HTTPException(400, "Invalid OTP")
         
-    user.hashed_password = get_password_hash(data.new_password)
+    user.hashed_password = await get_password_hash(data.new_password)
     user.otp_code = None
     await user.save()
+    invalidate_user(user.email)
     return {"message": "Password updated"}
 
 # --- OAUTH ENDPOINTS ---
@@ -191,6 +236,7 @@ async def google_login(data: OAuthLoginRequest):
     elif not user.is_verified:
         user.is_verified = True
         await user.save()
+        invalidate_user(user.email)
     
     token = create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
@@ -236,6 +282,7 @@ async def github_login(data: OAuthLoginRequest):
     elif not user.is_verified:
         user.is_verified = True
         await user.save()
+        invalidate_user(user.email)
         
     token = create_access_token({"sub": user.email})
     return {"access_token": token, "token_type": "bearer"}
@@ -0,0 +1,100 @@
+import asyncio
+from collections import OrderedDict
+from time import monotonic, perf_counter
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+class TTLCache:
+    """Size-bounded LRU whose entries expire after `ttl` seconds.
+
+    `get_or_compute` coalesces concurrent misses for the same key onto one call and
+    records how long each cached value took to produce, so hits report the latency saved.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.inflight: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.saved_seconds = 0.0
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self.entries.get(key)
+        return entry is not None and entry[1] >= monotonic()
+
+    def get(self, key: Hashable, default=None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return default
+        value, expires, cost = entry
+        if expires < monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.saved_seconds += cost
+        return value
+
+    def set(self, key: Hashable, value: Any, cost: float = 0.0, ttl: Optional[float] = None):
+        self.entries[key] = (value, monotonic() + (self.ttl if ttl is None else ttl), cost)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def pop(self, key: Hashable, default=None):
+        entry = self.entries.pop(key, None)
+        return default if entry is None else entry[0]
+
+    def clear(self):
+        self.entries.clear()
+
+    async def get_or_compute(self, key: Hashable, factory: Callable[[], Awaitable[Any]],
+                             cacheable: Callable[[Any], bool] = lambda value: True):
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+        if key in self.inflight:
+            future = self.inflight[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller doing the work went away; take over instead of failing too.
+                return await self.get_or_compute(key, factory, cacheable)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self.inflight[key] = future
+        start = perf_counter()
+        try:
+            value = await factory()
+        except BaseException as e:
+            if isinstance(e, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(e)
+                future.exception()  # mark retrieved: waiters re-raise it, nobody else needs to
+            raise
+        else:
+            if cacheable(value):
+                self.set(key, value, cost=perf_counter() - start)
+            future.set_result(value)
+            return value
+        finally:
+            self.inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
@@ -1,31 +1,36 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Depends, UploadFile, File, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
 from .auth import get_ws_user, get_current_user
 from .models import ChatMessage, ChatSession, User, Attachment
 import os
 import json
 import asyncio
-import google.generativeai as genai
-from groq import Groq
-from mistralai import Mistral
+from functools import partial
 from datetime import datetime
+from time import perf_counter
 from beanie import PydanticObjectId
-from .utils import handle_file_upload
-from .tools import search_web_consensus, generate_image_tool
-from .rag import add_to_vector_db, search_vector_db
+from .utils import handle_file_upload, ingest_path, iter_pdf_pages
+from .tools import search_web_consensus
+from .images import image_jobs
+from .rag import add_to_vector_db, has_documents, ingest_stream, search_vector_db
 from beanie.operators import Exists
+from .providers import GeminiProvider, GroqProvider, MistralProvider
+from .pipeline import StagePipeline, TurnScheduler
+from .intent import INTENT_CLASSIFIER, classify, confident
+from .streaming import StreamWriter
+from .routing import ProviderRouter, StreamResult
+from .response_cache import RESPONSE_CACHE, ResponseCache
+from .context import HISTORY_WINDOW, ContextBuilder, get_recent_messages, update_summary
+from .pagination import NEXT_CURSOR_HEADER, before_cursor, encode_cursor
+from .persistence import ConnectionSession, persistence
+from .metrics import errors_total, turn_seconds
+from .tracing import Trace, current_trace, trace_id
 
 router = APIRouter()
 
-genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-groq_client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-mistral_client = Mistral(api_key=os.getenv("MISTRAL_API_KEY"))
-
 hf_token = os.getenv("HF_API_KEY")
 
-gemini_model = genai.GenerativeModel(model_name='gemini-2.0-flash-lite')
-title_model = genai.GenerativeModel('gemini-2.0-flash-lite')
-
 current_date = datetime.now().strftime("%A, %B %d, %Y")
 
 BASE_CONSTRAINTS = """
@@ -41,13 +46,31 @@ GEMINI_PROMPT = f"Persona: Gemini. Date: {current_date}. {BASE_CONSTRAINTS}"
 GROQ_PROMPT = f"Persona: Gemini (via Groq). Date: {current_date}. {BASE_CONSTRAINTS}"
 MISTRAL_PROMPT = f"Persona: Gemini (via Mistral). Date: {current_date}. {BASE_CONSTRAINTS}"
 
+gemini_llm = GeminiProvider("gemini-2.0-flash-lite")
+groq_llm = GroqProvider("llama-3.3-70b-versatile", GROQ_PROMPT)
+mistral_llm = MistralProvider("mistral-small-latest", MISTRAL_PROMPT)
+title_llm = GeminiProvider("gemini-2.0-flash-lite")
+fast_llm = GroqProvider("llama-3.1-8b-instant")
+llm_router = ProviderRouter()
+response_cache = ResponseCache() if RESPONSE_CACHE else None
+
+CAPACITY_MESSAGE = "All AI systems are currently at capacity."
+REPLAY_CHUNK_CHARS = 64
+IMAGE_PLACEHOLDER = "_Generating image..._"
+EXPORT_BATCH_SIZE = 500
+
 async def safe_send(websocket: WebSocket, data: dict):
     try:
         await websocket.send_text(json.dumps(data))
-    except:
-        pass
+    except Exception:
+        errors_total.inc(where="send")
 
 async def detect_intent(user_msg: str) -> str:
+    label = "COMPLEX"
+    if INTENT_CLASSIFIER == "local":
+        label, confidence = classify(user_msg)
+        if confident(label, confidence):
+            return label
     try:
         check_prompt = (
             f"Classify the user intent for this message: '{user_msg}'.\n"
@@ -57,169 +80,308 @@ async def detect_intent(user_msg: str) -> str:
             "- Otherwise, reply exactly: COMPLEX\n"
             "Response must be ONE word only."
         )
-        resp = groq_client.chat.completions.create(
-            model="llama-3.1-8b-instant", 
-            messages=[{"role": "user", "content": check_prompt}],
-            max_tokens=5,
-            temperature=0  # Keep it deterministic
-        )
-        return resp.choices[0].message.content.strip().upper()
-    except:
-        return "COMPLEX"
+        resp = await fast_llm.complete(check_prompt, max_tokens=5, temperature=0)  # Keep it deterministic
+        return resp.strip().upper()
+    except Exception as e:
+        print(f"[INTENT] LLM fallback failed: {e}")
+        errors_total.inc(where="intent")
+        return label
 
-async def call_mistral(prompt, history, websocket, context):
-    try:
-        msgs = [{"role": "system", "content": MISTRAL_PROMPT}]
-        for h in history:
-            msgs.append({"role": "user" if h['role'] == 'user' else "assistant", "content": h['parts'][0]})
-        msgs.append({"role": "user", "content": f"CONTEXT: {context}\n\nUSER: {prompt}"})
-        full_resp = ""
-        stream = mistral_client.chat.stream(model="mistral-small-latest", messages=msgs)
-        for chunk in stream:
-            content = chunk.data.choices[0].delta.content
-            if content:
-                full_resp += content
-                await safe_send(websocket, {"type": "chunk", "content": content})
-        return full_resp
-    except:
-        return "All AI systems are currently at capacity."
-
-async def call_groq(prompt, history, websocket, context):
-    try:
-        msgs = [{"role": "system", "content": GROQ_PROMPT}]
-        for h in history:
-            msgs.append({"role": "user" if h['role'] == 'user' else "assistant", "content": h['parts'][0]})
-        msgs.append({"role": "user", "content": f"CONTEXT: {context}\n\nUSER: {prompt}"})
-        full_resp = ""
-        comp = groq_client.chat.completions.create(model="llama-3.3-70b-versatile", messages=msgs, stream=True)
-        for chunk in comp:
-            content = chunk.choices[0].delta.content
-            if content:
-                full_resp += content
-                await safe_send(websocket, {"type": "chunk", "content": content})
-        return full_resp
-    except:
-        await safe_send(websocket, {"type": "status", "content": "Switching to safety fallback..."})
-        return await call_mistral(prompt, history, websocket, context)
-
-async def call_gemini(prompt, history, websocket, context):
-    try:
-        chat = gemini_model.start_chat(history=history)
-        response_stream = await chat.send_message_async(f"CONTEXT: {context}\n\nUSER: {prompt}", stream=True)
-        full_resp = ""
-        async for chunk in response_stream:
-            if chunk.text:
-                full_resp += chunk.text
-                await safe_send(websocket, {"type": "chunk", "content": chunk.text})
-        return full_resp
-    except:
-        await safe_send(websocket, {"type": "status", "content": "Gemini busy, trying backup..."})
-        return await call_groq(prompt, history, websocket, context)
+async def call_providers(providers, prompt, context: ContextBuilder, websocket):
+    async def on_fallback(provider):
+        await safe_send(websocket, {"type": "status", "content": f"{provider.name.capitalize()} busy, trying backup..."})
+    result = await llm_router.stream(providers, prompt, context.fit, websocket, on_fallback)
+    return result if result is not None else StreamResult(CAPACITY_MESSAGE, "", False)
+
+async def call_mistral(prompt, context, websocket):
+    return await call_providers([mistral_llm], prompt, context, websocket)
+
+async def call_groq(prompt, context, websocket):
+    return await call_providers([groq_llm, mistral_llm], prompt, context, websocket)
+
+async def call_gemini(prompt, context, websocket):
+    return await call_providers([gemini_llm, groq_llm, mistral_llm], prompt, context, websocket)
+
+async def call_cached(call, prompt, context: ContextBuilder, websocket):
+    """Answers from the response cache when it can, replaying the hit through the chunk stream; otherwise runs `call` and caches its answer if one provider finished it cleanly."""
+    route, context_fp = call.__name__, context.fingerprint()
+    start = perf_counter()
+    cached, vector = await response_cache.lookup(route, prompt, context_fp)
+    if cached is not None:
+        for i in range(0, len(cached), REPLAY_CHUNK_CHARS):
+            await websocket.write(cached[i:i + REPLAY_CHUNK_CHARS])
+        return cached
+    result = await call(prompt, context, websocket)
+    if result.complete:
+        response_cache.store(route, prompt, context_fp, result.text, vector, cost=perf_counter() - start)
+    return result.text
 
 @router.websocket("/ws/{session_id}")
-async def websocket_endpoint(websocket: WebSocket, session_id: str, token: str):
+async def websocket_endpoint(websocket: WebSocket, session_id: str, token: str, compact: bool = False):
     user = await get_ws_user(token)
     if not user:
         await websocket.close(code=1008); return
+    conn = ConnectionSession(session_id, user.email)
+    if not await conn.authorize():
+        await websocket.close(code=1008); return
     await websocket.accept()
+    out = StreamWriter(websocket, compact=compact)
+    turns = TurnScheduler()
     try:
         while True:
-            data = await websocket.receive_text()
-            payload = json.loads(data)
-            msg_type, user_msg = payload.get("type", "message"), payload.get("message", "")
-            temp_id, attachment = payload.get("tempId"), payload.get("attachment")
-            
-            session = await ChatSession.find_one(ChatSession.session_id == session_id)
-            if not session:
-                session = await ChatSession(session_id=session_id, user_email=user.email, title="New Chat").insert()
-                await safe_send(websocket, {"type": "refresh-sessions"})
-            
-            if msg_type in ["edit", "regenerate"]:
-                trigger = await ChatMessage.find_one(ChatMessage.session_id == session_id, ChatMessage.content == user_msg)
-                if trigger:
-                    await ChatMessage.find(ChatMessage.session_id == session_id, ChatMessage.timestamp > trigger.timestamp).delete()
-            
-            db_atts = []
-            if attachment and attachment['type'] == 'text':
-                try: 
-                    await add_to_vector_db(attachment['content'], attachment['filename'], session_id)
-                    db_atts.append(Attachment(type='file', filename=attachment['filename']))
-                except: pass
-            
-            if msg_type == "message":
-                await ChatMessage(session_id=session_id, user_email=user.email, role="user", content=user_msg, attachments=db_atts).insert()
-            
-            await safe_send(websocket, {"type": "start", "tempId": temp_id})
-            
-            intent = await detect_intent(user_msg)
+            payload = json.loads(await websocket.receive_text())
+            if payload.get("type") == "cancel":
+                if turns.cancel():
+                    print(f"[CHAT] Cancelled turn in {session_id}")
+                continue
+            # The turn task copies the active context, so everything it starts reports to this trace.
+            with Trace(payload.get("traceId"), type=payload.get("type", "message")).activate():
+                turns.submit(partial(handle_turn, payload, conn, user, out, turns))
+    except Exception: pass
+    finally:
+        # Nobody is listening any more; stop paying for the answer.
+        turns.cancel()
+        await turns.join()
+        await persistence.flush(session_id)
+
+async def handle_turn(payload: dict, conn: ConnectionSession, user: User, out: StreamWriter, turns: TurnScheduler):
+    session_id = conn.session_id
+    msg_type, user_msg = payload.get("type", "message"), payload.get("message", "")
+    temp_id, attachment = payload.get("tempId"), payload.get("attachment")
+
+    pipe = StagePipeline()
+    trace = current_trace.get()
+    if trace is None:
+        trace = Trace()
+        current_trace.set(trace)
+    trace.record("queued", trace.started, pipe.started)
+    out.reset_stats()
+    route = "unknown"
+    try:
+        pipe.start("session", conn.get())
+
+        if msg_type in ["edit", "regenerate"]:
+            await truncate_after(session_id, user_msg)
+
+        user_message = None
+        if msg_type == "message":
+            user_message = ChatMessage(session_id=session_id, user_email=user.email, role="user", content=user_msg)
+        cutoff = user_message.timestamp if user_message else datetime.utcnow()
+
+        ingest_task = None
+        if attachment and attachment['type'] == 'text':
+            ingest_task = pipe.start("ingest", ingest_attachment(attachment, session_id, out))
+
+        pipe.start("intent", detect_intent(user_msg))
+        pipe.start("rag", retrieve_context(session_id, user_msg, ingest_task))
+        pipe.start("search", search_web_consensus(user_msg))
+        pipe.start("history", load_history(session_id, before=cutoff))
+        if user_message:
+            pipe.start("save_user", save_user_message(user_message, attachment, ingest_task))
+
+        session, created = await pipe.result("session")
+        persistence.touch(session)
+        if created:
+            await safe_send(out, {"type": "refresh-sessions"})
+
+        await safe_send(out, {"type": "start", "tempId": temp_id})
+
+        intent = await pipe.result("intent", "COMPLEX")
+        route = "image" if "IMAGE" in intent else "complex" if intent == "COMPLEX" else "simple"
+
+        if "IMAGE" in intent:
+            pipe.cancel("rag", "search", "history")
+            pipe.mark("ready")
+            # The turn ends here; the picture is pushed to the socket (and saved) whenever Horde finishes it.
+            job = image_jobs.submit(user_msg)
+            reply = ChatMessage(session_id=session_id, user_email=user.email, role="assistant", content="")
+            reply.id = PydanticObjectId()
+            await safe_send(out, {"type": "image_pending", "id": str(reply.id), "content": IMAGE_PLACEHOLDER})
+            turns.spawn(deliver_image(job, reply, out))
+            await pipe.result("save_user")
+        else:
+            if intent == "COMPLEX":
+                rag_ctx = await pipe.result("rag")
+                web_ctx = await pipe.result("search")
+            else:
+                pipe.cancel("rag", "search")
+                rag_ctx = web_ctx = None
+            history = await pipe.result("history", [])
+            context = ContextBuilder(user_msg, history, session, rag=rag_ctx, search=web_ctx)
+            pipe.mark("ready")
             
-            if "IMAGE" in intent:
-                await safe_send(websocket, {"type": "status", "content": "Generating vision assets..."})
-                img_md = await generate_image_tool(user_msg)
-                if not img_md:
-                     await safe_send(websocket, {
-                        "type": "status", 
-                        "content": "Generation failed. Try a simpler prompt." 
-                    })
-                await ChatMessage(session_id=session_id, user_email=user.email, role="assistant", content=img_md).insert()
-                await safe_send(websocket, {"type": "chunk", "content": img_md})
-                await safe_send(websocket, {"type": "end"})
+            call = call_gemini if intent == "COMPLEX" else call_groq
+            # Answers grounded in a user's own documents are never shared through the cache.
+            if response_cache and not attachment and not await has_documents(session_id):
+                full_resp = await call_cached(call, user_msg, context, out)
             else:
-                rag_task = asyncio.create_task(search_vector_db(session_id, user_msg))
-                web_task = asyncio.create_task(search_web_consensus(user_msg))
-                rag_ctx = await rag_task or "None"
-                web_ctx = await web_task or "None"
-                context = f"RAG: {rag_ctx}\nSEARCH: {web_ctx}"
-                history = await get_formatted_history(session_id)
-                
-                if intent == "COMPLEX":
-                    full_resp = await call_gemini(user_msg, history, websocket, context)
-                else:
-                    full_resp = await call_groq(user_msg, history, websocket, context)
-                
-                await ChatMessage(session_id=session_id, user_email=user.email, role="assistant", content=full_resp).insert()
-                await safe_send(websocket, {"type": "end"})
-
-            if session.title == "New Chat":
-                asyncio.create_task(generate_smart_title(session_id, user_msg, websocket))
+                full_resp = (await call(user_msg, context, out)).text
+            
+            await pipe.result("save_user")
+            persistence.add_message(ChatMessage(session_id=session_id, user_email=user.email, role="assistant", content=full_resp))
+            asyncio.create_task(update_summary(session, history, fast_llm))
 
-    except Exception: pass
+        await safe_send(out, {"type": "end", "trace": trace.id, "timings": pipe.finish(), "stream": out.stats()})
+
+        if session.title == "New Chat":
+            asyncio.create_task(generate_smart_title(session, user_msg, out))
+
+    except asyncio.CancelledError:
+        # Ingestion and the user's own message are left to finish; everything else is abandoned.
+        pipe.cancel("session", "intent", "rag", "search", "history")
+        route = "cancelled"
+        await finish_cancelled(pipe, session_id, user, out)
+        raise
+    except Exception as e:
+        print(f"[CHAT ERROR][{trace.id}] {e}")
+        errors_total.inc(where="turn")
+        route = "error"
+        await safe_send(out, {"type": "end", "trace": trace.id, "timings": pipe.finish(), "stream": out.stats()})
+    finally:
+        turn_seconds.observe(perf_counter() - pipe.started, route=route)
+        trace.finish()
+
+async def deliver_image(job, reply: ChatMessage, out: StreamWriter):
+    try:
+        reply.content = await asyncio.shield(job.result)
+    except asyncio.CancelledError:
+        # Cancelled or disconnected: withdraw the Horde job unless another turn is waiting on it.
+        image_jobs.release(job)
+        await safe_send(out, {"type": "image", "id": str(reply.id), "content": "_Image generation cancelled._"})
+        raise
+    image_jobs.release(job)
+    persistence.add_message(reply)
+    await safe_send(out, {"type": "image", "id": str(reply.id), "content": reply.content})
+
+async def finish_cancelled(pipe: StagePipeline, session_id: str, user: User, out: StreamWriter):
+    """Keep whatever the user already saw, then tell the client the turn is over."""
+    shown = out.streamed_text()
+    try:
+        await pipe.result("save_user")
+        if shown:
+            persistence.add_message(ChatMessage(session_id=session_id, user_email=user.email, role="assistant", content=shown))
+    except Exception as e:
+        print(f"[CHAT ERROR] Saving cancelled turn: {e}")
+    await safe_send(out, {"type": "end", "cancelled": True, "trace": trace_id(), "timings": pipe.finish(), "stream": out.stats()})
+
+async def truncate_after(session_id: str, user_msg: str):
+    await persistence.flush(session_id)
+    trigger = await ChatMessage.find_one(ChatMessage.session_id == session_id, ChatMessage.content == user_msg)
+    if trigger:
+        await ChatMessage.find(ChatMessage.session_id == session_id, ChatMessage.timestamp > trigger.timestamp).delete()
 
-async def get_formatted_history(session_id: str):
-    msgs = await ChatMessage.find(ChatMessage.session_id == session_id).sort(-ChatMessage.timestamp).limit(5).to_list()
-    msgs.reverse()
-    return [{"role": "user" if m.role == "user" else "model", "parts": [m.content]} for m in msgs if m.content]
+async def ingest_attachment(attachment: dict, session_id: str, websocket) -> int:
+    filename = attachment['filename']
 
-async def generate_smart_title(session_id, user_msg, websocket):
+    async def progress(chunks):
+        await safe_send(websocket, {"type": "ingest_progress", "filename": filename, "chunks": chunks})
+
+    if not attachment.get('file_id'):
+        return await add_to_vector_db(attachment['content'], filename, session_id, progress)
+    path = ingest_path(attachment['file_id'])
+    try:
+        return await ingest_stream(iter_pdf_pages(path, pages=attachment.get('pages')), filename, session_id, progress)
+    except Exception:
+        await safe_send(websocket, {"type": "status", "content": f"Could not read {filename}."})
+        raise
+    finally:
+        if os.path.exists(path): os.remove(path)
+
+async def retrieve_context(session_id: str, user_msg: str, ingest_task=None):
+    if ingest_task:
+        # Shielded so cancelling retrieval never aborts the upload's ingestion.
+        await asyncio.gather(asyncio.shield(ingest_task), return_exceptions=True)
+    return await search_vector_db(session_id, user_msg)
+
+async def save_user_message(message: ChatMessage, attachment, ingest_task=None):
+    if ingest_task:
+        try:
+            await asyncio.shield(ingest_task)
+            message.attachments.append(Attachment(type='file', filename=attachment['filename']))
+        except Exception:
+            errors_total.inc(where="ingest")
+    persistence.add_message(message)
+
+async def load_history(session_id: str, before: datetime):
+    # Earlier turns may still be queued for writing. They are merged in, not waited for. The snapshot
+    # is taken before the read so a message stored during the read is in at least one of the two.
+    pending = [m for m in persistence.pending_messages(session_id) if m.timestamp < before]
+    stored = await get_recent_messages(session_id, before=before)
+    seen = {m.id for m in stored}
+    merged = stored + [m for m in pending if m.id not in seen]
+    merged.sort(key=lambda m: m.timestamp)
+    return merged[-HISTORY_WINDOW:]
+
+async def generate_smart_title(session: ChatSession, user_msg, websocket):
     try:
         title = user_msg[:30] + "..."
         try:
-            res = await title_model.generate_content_async(f"Give a 3-word title for: {user_msg}")
-            title = res.text.strip().replace('"', '')
-        except:
+            res = await title_llm.complete(f"Give a 3-word title for: {user_msg}")
+            title = res.strip().replace('"', '')
+        except Exception:
             try:
-                res = groq_client.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role":"user","content":f"Title in 3 words: {user_msg}"}], max_tokens=10)
-                title = res.choices[0].message.content.strip().replace('"', '')
-            except: pass
+                res = await fast_llm.complete(f"Title in 3 words: {user_msg}", max_tokens=10)
+                title = res.strip().replace('"', '')
+            except Exception:
+                errors_total.inc(where="title")
         
-        session = await ChatSession.find_one(ChatSession.session_id == session_id)
-        if session:
-            session.title = title
-            await session.save()
-            await safe_send(websocket, {"type": "title_update", "id": session_id, "title": title})
-    except: pass
+        session.title = title
+        persistence.update_session(session.session_id, title=title)
+        await persistence.flush(session.session_id)
+        await safe_send(websocket, {"type": "title_update", "id": session.session_id, "title": title})
+    except Exception as e:
+        print(f"[TITLE] {e}")
+        errors_total.inc(where="title")
 
 @router.post("/sessions")
 async def create_session(user: User = Depends(get_current_user)):
     return await ChatSession(session_id=str(PydanticObjectId()), user_email=user.email, title="New Chat").insert()
 
 @router.get("/sessions")
-async def get_sessions(user: User = Depends(get_current_user)):
-    return await ChatSession.find(ChatSession.user_email == user.email).sort(-ChatSession.updated_at).to_list()
+async def get_sessions(response: Response, limit: int = Query(100, ge=1, le=500), before: Optional[str] = None,
+                       user: User = Depends(get_current_user)):
+    """Newest first. Pass the `X-Next-Cursor` header back as `before` for the next page."""
+    query = {"user_email": user.email, **before_cursor("updated_at", before)}
+    page = await ChatSession.find(query).sort(-ChatSession.updated_at, -ChatSession.id).limit(limit + 1).to_list()
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1].updated_at, page[-1].id)
+    return page
 
 @router.get("/sessions/{session_id}/messages")
-async def get_messages(session_id: str, user: User = Depends(get_current_user)):
-    return await ChatMessage.find(ChatMessage.session_id == session_id).sort(+ChatMessage.timestamp).to_list()
+async def get_messages(session_id: str, response: Response, limit: int = Query(50, ge=1, le=200),
+                       before: Optional[str] = None, user: User = Depends(get_current_user)):
+    """The latest `limit` messages older than `before`, oldest first; `X-Next-Cursor` points at the page before them."""
+    query = {"session_id": session_id, "user_email": user.email, **before_cursor("timestamp", before)}
+    page = await ChatMessage.find(query).sort(-ChatMessage.timestamp, -ChatMessage.id).limit(limit + 1).to_list()
+    if len(page) > limit:
+        page = page[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(page[-1].timestamp, page[-1].id)
+    page.reverse()
+    return page
+
+@router.get("/sessions/{session_id}/export")
+async def export_messages(session_id: str, user: User = Depends(get_current_user)):
+    """The whole conversation as NDJSON, streamed from the cursor without loading it into memory."""
+    cursor = ChatMessage.get_pymongo_collection().find(
+        {"session_id": session_id, "user_email": user.email}, {"user_email": 0}
+    ).sort([("timestamp", 1), ("_id", 1)]).batch_size(EXPORT_BATCH_SIZE)
+
+    async def lines():
+        batch = []
+        async for doc in cursor:
+            batch.append(json.dumps(doc, default=_json_default))
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield "\n".join(batch) + "\n"
+                batch = []
+        if batch:
+            yield "\n".join(batch) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Content-Disposition": f'attachment; filename="{session_id}.ndjson"'})
+
+def _json_default(value):
+    return value.isoformat() if isinstance(value, datetime) else str(value)
 
 @router.post("/upload")
 async def upload_file(file: UploadFile = File(...), user: User = Depends(get_current_user)):
@@ -0,0 +1,142 @@
+import os
+import re
+from typing import AsyncIterator, Iterator, List, NamedTuple
+
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 200))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+# A paragraph break closes the current chunk once it is at least this full.
+CHUNK_MIN_FILL = float(os.getenv("CHUNK_MIN_FILL", 0.5))
+
+_PARAGRAPH = re.compile(r"\n[ \t]*\n\s*")
+_SENTENCE = re.compile(r"(?<=[.!?])\s+")
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+def count_tokens(text: str) -> int:
+    """Conservative WordPiece estimate: one token per word or symbol, plus one per 6
+    characters beyond the first 6 of a long word (rare words split into sub-pieces)."""
+    return sum(1 + max(0, len(m.group()) - 6) // 6 for m in _TOKEN.finditer(text))
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Longest prefix of `text`, cut between tokens, whose `count_tokens` estimate fits in `max_tokens`."""
+    total = 0
+    for m in _TOKEN.finditer(text):
+        total += 1 + max(0, len(m.group()) - 6) // 6
+        if total > max_tokens:
+            return text[:m.start()].rstrip()
+    return text
+
+class Unit(NamedTuple):
+    text: str
+    tokens: int
+    paragraph_end: bool
+
+class TokenChunker:
+    """Packs sentences into chunks of at most `max_tokens`, preferring paragraph breaks and
+    carrying `overlap_tokens` of trailing sentences into the next chunk when it has to cut
+    mid-paragraph. Text can be fed incrementally (e.g. page by page); only the unfinished
+    sentence is held back, so total work stays linear in the input."""
+
+    def __init__(self, max_tokens: int = CHUNK_MAX_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS, min_fill: float = CHUNK_MIN_FILL):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.min_tokens = int(max_tokens * min_fill)
+        self.units: List[Unit] = []
+        self.tokens = 0
+        self.carried = 0
+        self.pending = ""
+
+    def feed(self, text: str) -> Iterator[str]:
+        paragraphs = _PARAGRAPH.split(self.pending + text)
+        self.pending = ""
+        for i, paragraph in enumerate(paragraphs):
+            sentences = _SENTENCE.split(paragraph)
+            if i == len(paragraphs) - 1:
+                # The last sentence may continue in the next feed; hold it back unless it is already too big to wait.
+                tail = sentences.pop()
+                if count_tokens(tail) <= self.max_tokens:
+                    self.pending = tail
+                else:
+                    sentences.append(tail)
+                yield from self._add_sentences(sentences, paragraph_end=False)
+            else:
+                yield from self._add_sentences(sentences, paragraph_end=True)
+
+    def finish(self) -> Iterator[str]:
+        yield from self._add_sentences([self.pending], paragraph_end=True)
+        self.pending = ""
+        if len(self.units) > self.carried:
+            yield self._emit(keep_overlap=False)
+
+    def _add_sentences(self, sentences: List[str], paragraph_end: bool) -> Iterator[str]:
+        sentences = [" ".join(s.split()) for s in sentences]
+        sentences = [s for s in sentences if s]
+        for n, sentence in enumerate(sentences):
+            last = paragraph_end and n == len(sentences) - 1
+            for unit in self._split_oversized(sentence, last):
+                if self.units and self.tokens + unit.tokens > self.max_tokens:
+                    if len(self.units) > self.carried:
+                        yield self._emit(keep_overlap=True)
+                    # Trim the carried overlap from the front until this sentence fits; never emit it twice.
+                    while self.units and self.tokens + unit.tokens > self.max_tokens:
+                        self.tokens -= self.units.pop(0).tokens
+                        self.carried -= 1
+                self.units.append(unit)
+                self.tokens += unit.tokens
+            if last and self.tokens >= self.min_tokens and len(self.units) > self.carried:
+                yield self._emit(keep_overlap=False)
+
+    def _split_oversized(self, sentence: str, paragraph_end: bool) -> Iterator[Unit]:
+        tokens = count_tokens(sentence)
+        if tokens <= self.max_tokens:
+            yield Unit(sentence, tokens, paragraph_end)
+            return
+        words = (part for word in sentence.split(" ") for part in self._split_word(word))
+        piece, piece_tokens = [], 0
+        for word in words:
+            word_tokens = count_tokens(word)
+            if piece and piece_tokens + word_tokens > self.max_tokens:
+                yield Unit(" ".join(piece), piece_tokens, False)
+                piece, piece_tokens = [], 0
+            piece.append(word)
+            piece_tokens += word_tokens
+        if piece:
+            yield Unit(" ".join(piece), piece_tokens, paragraph_end)
+
+    def _split_word(self, word: str) -> Iterator[str]:
+        """Cuts a space-less run (a URL, base64, a table row) into pieces of at most `max_tokens`."""
+        while count_tokens(word) > self.max_tokens:
+            head = truncate_tokens(word, self.max_tokens)
+            if not head:
+                # A single enormous token; `count_tokens` charges one token per 6 characters of it.
+                head = word[:self.max_tokens * 6]
+            yield head
+            word = word[len(head):]
+        if word:
+            yield word
+
+    def _emit(self, keep_overlap: bool) -> str:
+        parts = []
+        for unit in self.units:
+            parts.append(unit.text)
+            parts.append("\n\n" if unit.paragraph_end else " ")
+        chunk = "".join(parts[:-1])
+
+        carried, carried_tokens = [], 0
+        if keep_overlap and not self.units[-1].paragraph_end:
+            for unit in reversed(self.units[1:]):
+                if carried_tokens + unit.tokens > self.overlap_tokens:
+                    break
+                carried.append(unit)
+                carried_tokens += unit.tokens
+        self.units = carried[::-1]
+        self.tokens = carried_tokens
+        self.carried = len(carried)
+        return chunk
+
+async def token_chunks(texts: AsyncIterator[str], **options) -> AsyncIterator[str]:
+    chunker = TokenChunker(**options)
+    async for text in texts:
+        for chunk in chunker.feed(text):
+            yield chunk
+    for chunk in chunker.finish():
+        yield chunk
@@ -0,0 +1,151 @@
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from .chunking import count_tokens, truncate_tokens
+from .models import ChatMessage, ChatSession
+from .metrics import db_seconds
+
+# Input-token budget per model. This is deliberately far below the context windows: it
+# bounds time-to-first-token and cost, and keeps Groq under its per-minute token limits.
+CONTEXT_BUDGETS = {
+    "gemini-2.0-flash-lite": 8000,
+    "llama-3.3-70b-versatile": 6000,
+    "mistral-small-latest": 6000,
+}
+for item in filter(None, os.getenv("CONTEXT_BUDGETS", "").split(",")):
+    model, _, tokens = item.partition("=")
+    CONTEXT_BUDGETS[model.strip()] = int(tokens)
+CONTEXT_BUDGET_DEFAULT = int(os.getenv("CONTEXT_BUDGET_DEFAULT", 6000))
+# The providers' tokenizers, relative to the WordPiece estimate in `count_tokens`.
+TOKEN_RATIOS = {"gemini": 1.0, "groq": 0.9, "mistral": 1.1}
+
+HISTORY_WINDOW = int(os.getenv("HISTORY_WINDOW", 12))
+HISTORY_KEEP = int(os.getenv("HISTORY_KEEP", 6))
+SUMMARY_MIN_MESSAGES = int(os.getenv("SUMMARY_MIN_MESSAGES", 4))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", 300))
+RAG_SHARE = 0.4
+SEARCH_SHARE = 0.25
+RAG_SEPARATOR = "\n---\n"
+
+class ContextBuilder:
+    """Fits one turn's history and retrieved context into each provider's token budget.
+
+    The prompt and system prompt are always sent in full. The rest of the budget is
+    filled in priority order:
+    - the latest exchange
+    - document (RAG) chunks, whole chunks in rank order
+    - the rolling summary of older turns
+    - web results
+    - earlier verbatim turns, newest first
+
+    Sections are cut when the remaining budget runs out. Messages already folded into
+    the session summary are never sent verbatim.
+    """
+
+    def __init__(self, prompt: str, messages: List[ChatMessage], session: Optional[ChatSession] = None,
+                 rag: Optional[str] = None, search: Optional[str] = None):
+        self.prompt = prompt
+        self.summary = session.summary if session else None
+        until = session.summary_until if session else None
+        self.messages = [m for m in messages if m.content and (until is None or m.timestamp > until)]
+        self.rag = rag
+        self.search = search
+        self.fitted: Dict[tuple, Tuple[List[dict], str]] = {}
+        self.usage: Dict[str, dict] = {}
+
+    def fingerprint(self) -> str:
+        """Identifies everything besides the prompt that the answer depends on."""
+        payload = json.dumps([self.summary, self.rag, self.search, [(m.role, m.content) for m in self.messages]])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+    def fit(self, provider) -> Tuple[List[dict], str]:
+        budget = CONTEXT_BUDGETS.get(provider.model, CONTEXT_BUDGET_DEFAULT)
+        ratio = TOKEN_RATIOS.get(provider.name, 1.0)
+        key = (budget, ratio, provider.system_prompt)
+        if key not in self.fitted:
+            self.fitted[key] = self._fit(provider, int(budget / ratio))
+        return self.fitted[key]
+
+    def _fit(self, provider, budget: int) -> Tuple[List[dict], str]:
+        used = count_tokens(provider.system_prompt or "") + count_tokens(self.prompt) + 16
+        remaining = max(budget - used, 0)
+
+        def take(text: str, cap: int) -> str:
+            nonlocal remaining
+            if not text or remaining <= 0:
+                return ""
+            text = truncate_tokens(text, min(cap, remaining))
+            remaining -= count_tokens(text)
+            return text
+
+        newest_first = list(reversed(self.messages))
+        kept = []
+        for m in newest_first[:2]:
+            content = take(m.content, remaining)
+            if content:
+                kept.append((m, content))
+
+        rag_parts = []
+        rag_cap = int(budget * RAG_SHARE)
+        for chunk in (self.rag or "").split(RAG_SEPARATOR):
+            piece = take(chunk, rag_cap - sum(map(count_tokens, rag_parts)))
+            if not piece:
+                break
+            rag_parts.append(piece)
+            if piece != chunk:
+                break
+        summary = take(self.summary, SUMMARY_MAX_TOKENS)
+        search = take(self.search, int(budget * SEARCH_SHARE))
+
+        for m in newest_first[2:]:
+            if count_tokens(m.content) > remaining:
+                break
+            kept.append((m, take(m.content, remaining)))
+        kept.sort(key=lambda pair: pair[0].timestamp)
+
+        history = [{"role": "user" if m.role == "user" else "model", "parts": [content]} for m, content in kept]
+        context = f"RAG: {RAG_SEPARATOR.join(rag_parts) or 'None'}\nSEARCH: {search or 'None'}"
+        if summary:
+            context = f"EARLIER IN THIS CONVERSATION: {summary}\n{context}"
+        self.usage[provider.name] = {"budget": budget, "used": budget - remaining, "history": len(kept)}
+        return history, context
+
+async def get_recent_messages(session_id: str, before: datetime = None, limit: int = HISTORY_WINDOW) -> List[ChatMessage]:
+    query = ChatMessage.find(ChatMessage.session_id == session_id)
+    if before:
+        query = query.find(ChatMessage.timestamp < before)
+    with db_seconds.time(op="load_history"):
+        msgs = await query.sort(-ChatMessage.timestamp).limit(limit).to_list()
+    msgs.reverse()
+    return msgs
+
+_summarizing = set()
+
+async def update_summary(session: ChatSession, messages: List[ChatMessage], llm):
+    """Folds turns that have dropped out of the verbatim window into the session's rolling summary.
+
+    Runs after the reply, off the critical path. It waits until at least
+    `SUMMARY_MIN_MESSAGES` turns have aged out, so the summary is rewritten every few
+    turns rather than on every one.
+    """
+    until = session.summary_until
+    aged = [m for m in messages[:-HISTORY_KEEP] if m.content and (until is None or m.timestamp > until)]
+    if len(aged) < SUMMARY_MIN_MESSAGES or session.session_id in _summarizing:
+        return
+    _summarizing.add(session.session_id)
+    try:
+        transcript = "\n".join(f"{m.role.upper()}: {truncate_tokens(m.content, 400)}" for m in aged)
+        prompt = (
+            f"Previous summary: {session.summary or 'None'}\n\nNew messages:\n{transcript}\n\n"
+            f"Update the summary of this conversation in at most {SUMMARY_MAX_TOKENS // 2} words. "
+            "Keep names, numbers, decisions and open questions. Reply with the summary only."
+        )
+        summary = (await llm.complete(prompt, max_tokens=SUMMARY_MAX_TOKENS, temperature=0)).strip()
+        # `set` rather than `save` so that summarising does not bump the session's updated_at.
+        await session.set({ChatSession.summary: summary, ChatSession.summary_until: aged[-1].timestamp})
+    except Exception as e:
+        print(f"[CONTEXT] Summary failed for {session.session_id}: {e}")
+    finally:
+        _summarizing.discard(session.session_id)
@@ -1,11 +1,79 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from .models import User, ChatMessage, ChatSession
+from .rag import vector_collection, ensure_vector_indexes
 import os
 import certifi
 
+# Dev/CI: explain the hot queries at startup and warn about any that are not index-backed.
+DB_EXPLAIN_ON_STARTUP = os.getenv("DB_EXPLAIN_ON_STARTUP", "false").lower() == "true"
+
 async def init_db():
+    # Unset means a local mongod on the default port, as Motor does with no URI.
     mongo_uri = os.getenv("MONGO_URI")
-    client = AsyncIOMotorClient(mongo_uri, tlsCAFile=certifi.where())
-    
-    await init_beanie(database=client.ai_chatbot_db, document_models=[User, ChatMessage, ChatSession])
\ No newline at end of file
+    uri = (mongo_uri or "").lower()
+    # tlsCAFile implies TLS, so it is only passed for Atlas-style URIs; a plain local mongod (load tests, dev) has none.
+    tls = {"tlsCAFile": certifi.where()} if uri.startswith("mongodb+srv://") or "tls=true" in uri else {}
+    client = AsyncIOMotorClient(mongo_uri, **tls)
+
+    await check_unique_emails(client.ai_chatbot_db)
+    # Creates the indexes declared in each model's Settings.
+    await init_beanie(database=client.ai_chatbot_db, document_models=[User, ChatMessage, ChatSession])
+    await ensure_vector_indexes()
+    if DB_EXPLAIN_ON_STARTUP:
+        await check_query_plans()
+
+async def check_unique_emails(db):
+    """The users.email index is unique; building it fails on a database that already has duplicate
+    emails. Say which ones, instead of letting init_beanie die on a bare DuplicateKeyError."""
+    if "email_unique" in await db.users.index_information():
+        return
+    duplicates = await db.users.aggregate([
+        {"$group": {"_id": "$email", "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+        {"$limit": 5},
+    ]).to_list(None)
+    if duplicates:
+        emails = ", ".join(f"{d['_id']} (x{d['count']})" for d in duplicates)
+        raise RuntimeError(f"users has duplicate emails ({emails}); merge or delete the extra accounts before "
+                           "starting. See 'Upgrading an existing database' in the README.")
+
+def plan_stages(plan: dict) -> set:
+    stages = {plan.get("stage")} if plan.get("stage") else set()
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages |= plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages |= plan_stages(child)
+    return stages
+
+async def explain(collection, query: dict, sort=None, limit: int = 0) -> dict:
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return await cursor.explain()
+
+def hot_queries():
+    """The per-request queries that must never fall back to a collection scan."""
+    probe = "__plan_check__"
+    return [
+        ("message history", ChatMessage.get_pymongo_collection(), {"session_id": probe}, [("timestamp", -1)]),
+        ("session lookup", ChatSession.get_pymongo_collection(), {"session_id": probe}, None),
+        ("session list", ChatSession.get_pymongo_collection(), {"user_email": probe}, [("updated_at", -1)]),
+        ("user lookup", User.get_pymongo_collection(), {"email": probe}, None),
+        ("session chunks", vector_collection, {"session_id": probe}, None),
+    ]
+
+async def check_query_plans():
+    for name, collection, query, sort in hot_queries():
+        try:
+            stages = plan_stages((await explain(collection, query, sort, limit=5))["queryPlanner"]["winningPlan"])
+        except Exception as e:
+            print(f"[DB] Could not explain {name}: {e}")
+            continue
+        if "COLLSCAN" in stages or ("SORT" in stages and sort):
+            print(f"[DB][WARN] {name} on {collection.name} is not index-backed: {sorted(stages)}")
+        else:
+            print(f"[DB] {name} on {collection.name}: {sorted(stages)}")
@@ -0,0 +1,82 @@
+import os
+import asyncio
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List
+from pymongo.errors import BulkWriteError
+
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 20000))
+
+def content_key(model_id: str, text: str) -> str:
+    return hashlib.sha256(f"{model_id}\x00{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Two-tier embedding cache: an in-process LRU (float32 arrays) in front of an optional
+    Mongo collection, both keyed by sha256(model id + text)."""
+
+    def __init__(self, collection=None, max_entries: int = EMBEDDING_CACHE_SIZE):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.hits_memory = 0
+        self.hits_persistent = 0
+        self.misses = 0
+        self._pending_writes = set()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self.entries[key] = vector
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found = {}
+        for key in keys:
+            vector = self.entries.get(key)
+            if vector is not None:
+                self.entries.move_to_end(key)
+                found[key] = vector.tolist()
+        self.hits_memory += len(found)
+
+        remaining = [k for k in keys if k not in found]
+        if remaining and self.collection is not None:
+            try:
+                async for doc in self.collection.find({"_id": {"$in": remaining}}, {"embedding": 1}):
+                    found[doc["_id"]] = doc["embedding"]
+                    self._remember(doc["_id"], np.asarray(doc["embedding"], dtype=np.float32))
+                    self.hits_persistent += 1
+            except Exception as e:
+                print(f"[EMBED CACHE ERROR] lookup: {e}")
+        self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model_id: str, vectors: Dict[str, List[float]]):
+        for key, vector in vectors.items():
+            self._remember(key, np.asarray(vector, dtype=np.float32))
+        if vectors and self.collection is not None:
+            # Persisted off the request path; a lost write only costs a future re-embed.
+            task = asyncio.create_task(self._persist(model_id, vectors))
+            self._pending_writes.add(task)
+            task.add_done_callback(self._pending_writes.discard)
+
+    async def _persist(self, model_id: str, vectors: Dict[str, List[float]]):
+        now = datetime.utcnow()
+        docs = [{"_id": k, "model": model_id, "embedding": v, "created_at": now} for k, v in vectors.items()]
+        try:
+            await self.collection.insert_many(docs, ordered=False)
+        except BulkWriteError:
+            pass  # Another worker cached the same content first.
+        except Exception as e:
+            print(f"[EMBED CACHE ERROR] persist: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.hits_memory + self.hits_persistent + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits_memory": self.hits_memory,
+            "hits_persistent": self.hits_persistent,
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,154 @@
+import os
+import asyncio
+import httpx
+import numpy as np
+from typing import List, Optional
+
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "hf")
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_RETRIES = 3
+EMBEDDING_MODEL_DIR = os.getenv("EMBEDDING_MODEL_DIR", "models/all-MiniLM-L6-v2")
+
+HF_TOKEN = os.getenv("HF_API_KEY")
+# Added explicit task routing to the URL to force Feature Extraction
+EMBEDDING_MODEL_URL = "https://router.huggingface.co/hf-inference/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction"
+
+def batched(items: list, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class EmbeddingBackend:
+    """Turns a list of texts into a list of vectors (None where a text could not be embedded)."""
+    model_id = "sentence-transformers/all-MiniLM-L6-v2"
+
+    async def embed(self, texts: List[str]) -> List[Optional[List[float]]]:
+        raise NotImplementedError
+
+    async def aclose(self):
+        pass
+
+class HFInferenceBackend(EmbeddingBackend):
+    def __init__(self, url: str = EMBEDDING_MODEL_URL, token: Optional[str] = HF_TOKEN,
+                 batch_size: int = EMBEDDING_BATCH_SIZE, max_concurrency: int = EMBEDDING_MAX_CONCURRENCY):
+        self.url = url
+        self.token = token
+        self.batch_size = batch_size
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+        )
+
+    async def embed(self, texts):
+        if not self.token:
+            print("[ERROR] HF_TOKEN missing in environment variables.")
+            return [None] * len(texts)
+        results = await asyncio.gather(*(self._embed_batch(batch) for batch in batched(texts, self.batch_size)))
+        return [vec for batch in results for vec in batch]
+
+    async def _embed_batch(self, texts: List[str]):
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json",
+            "X-Wait-For-Model": "true"
+        }
+        async with self.semaphore:
+            for attempt in range(EMBEDDING_RETRIES):
+                try:
+                    response = await self.client.post(self.url, headers=headers, json={"inputs": texts})
+                    if response.status_code == 200:
+                        return self._parse(response.json(), len(texts))
+                    if response.status_code not in (429, 503):
+                        print(f"[ERROR] HF Embedding failed: {response.status_code} - {response.text}")
+                        break
+                except Exception as e:
+                    print(f"[EXCEPTION] HF embed batch: {e}")
+                if attempt + 1 < EMBEDDING_RETRIES:
+                    await asyncio.sleep(2 ** attempt)
+        return [None] * len(texts)
+
+    @staticmethod
+    def _parse(result, expected: int):
+        if isinstance(result, list) and result and not isinstance(result[0], list):
+            result = [result]
+        if not isinstance(result, list) or len(result) != expected:
+            return [None] * expected
+        vectors = []
+        for item in result:
+            # Token-level output (no pooling on the endpoint): mean-pool it ourselves.
+            if item and isinstance(item[0], list):
+                item = np.asarray(item, dtype=np.float32).mean(axis=0).tolist()
+            vectors.append(item)
+        return vectors
+
+    async def aclose(self):
+        await self.client.aclose()
+
+class LocalOnnxBackend(EmbeddingBackend):
+    """In-process MiniLM encoder: an exported `model.onnx` plus its `tokenizer.json`, mean-pooled and
+    L2-normalised like sentence-transformers so vectors stay compatible with the hosted model."""
+
+    def __init__(self, model_dir: str = EMBEDDING_MODEL_DIR, batch_size: int = EMBEDDING_BATCH_SIZE, max_length: int = 256):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            raise RuntimeError("EMBEDDING_BACKEND=local needs `pip install -r requirements-local-embeddings.txt`") from e
+        missing = [f for f in ("model.onnx", "tokenizer.json") if not os.path.exists(os.path.join(model_dir, f))]
+        if missing:
+            raise RuntimeError(
+                f"EMBEDDING_BACKEND=local: {', '.join(missing)} not found in {model_dir}. Export the model with\n"
+                f"  optimum-cli export onnx --model sentence-transformers/all-MiniLM-L6-v2 --task feature-extraction {model_dir}\n"
+                "or set EMBEDDING_MODEL_DIR to a directory that has them."
+            )
+
+        self.model_id = f"local/{os.path.basename(os.path.normpath(model_dir))}"
+        self.batch_size = batch_size
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = int(os.getenv("EMBEDDING_THREADS", os.cpu_count() or 1))
+        self.session = ort.InferenceSession(os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        # One batch at a time: onnxruntime already uses every core for a single run.
+        self.lock = asyncio.Lock()
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": ids, "attention_mask": mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(ids)
+        hidden = self.session.run(None, feeds)[0]
+        weights = mask[..., None].astype(np.float32)
+        pooled = (hidden * weights).sum(axis=1) / np.clip(weights.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    async def embed(self, texts):
+        # Length-sorted batches keep padding (and wasted FLOPs) to a minimum.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for batch in batched(order, self.batch_size):
+            async with self.lock:
+                encoded = await asyncio.to_thread(self._encode, [texts[i] for i in batch])
+            for i, vec in zip(batch, encoded.tolist()):
+                vectors[i] = vec
+        return vectors
+
+_backend: Optional[EmbeddingBackend] = None
+
+def get_backend() -> EmbeddingBackend:
+    global _backend
+    if _backend is None:
+        _backend = LocalOnnxBackend() if EMBEDDING_BACKEND == "local" else HFInferenceBackend()
+    return _backend
+
+async def close_backend():
+    global _backend
+    if _backend:
+        await _backend.aclose()
+        _backend = None
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException
+import numpy as np
+
+EXECUTOR_THREADS = int(os.getenv("EXECUTOR_THREADS", min(32, (os.cpu_count() or 1) + 4)))
+EXECUTOR_THREAD_QUEUE = int(os.getenv("EXECUTOR_THREAD_QUEUE", 64))
+EXECUTOR_PROCESSES = int(os.getenv("EXECUTOR_PROCESSES", os.cpu_count() or 1))
+EXECUTOR_PROCESS_QUEUE = int(os.getenv("EXECUTOR_PROCESS_QUEUE", 16))
+EXECUTOR_START_METHOD = os.getenv("EXECUTOR_START_METHOD", "spawn")
+EXECUTOR_RETRY_AFTER = 2
+METRICS_WINDOW = 1000
+
+class ExecutorBusy(HTTPException):
+    def __init__(self, name: str):
+        super().__init__(status_code=503, detail=f"Server busy ({name}), try again shortly",
+                         headers={"Retry-After": str(EXECUTOR_RETRY_AFTER)})
+
+def _timed(fn, args, kwargs):
+    # Wall-clock rather than perf_counter: the stamps have to be comparable across processes.
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+class BoundedExecutor:
+    """A thread or process pool that refuses work instead of queueing without bound.
+
+    At most `workers + max_queue` jobs are admitted at once, counted until the pool has
+    finished them (even if the caller was cancelled). Beyond that `run` raises
+    `ExecutorBusy` (a 503) straight away, so a burst sheds load instead of piling up
+    behind the pool. Wait (queued) and run times are kept for the last `METRICS_WINDOW` jobs.
+    Process pool jobs must be picklable module-level functions.
+    """
+
+    def __init__(self, name: str, kind: str, workers: int, max_queue: int):
+        self.name = name
+        self.kind = kind
+        self.workers = max(workers, 1)
+        self.max_queue = max_queue
+        self.pool = None
+        self.inflight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.failed = 0
+        self.waits = deque(maxlen=METRICS_WINDOW)
+        self.runs = deque(maxlen=METRICS_WINDOW)
+
+    def _pool(self):
+        if self.pool is None:
+            if self.kind == "process":
+                context = multiprocessing.get_context(EXECUTOR_START_METHOD)
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            else:
+                self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix=self.name)
+        return self.pool
+
+    async def run(self, fn, *args, **kwargs):
+        if self.inflight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(self.name)
+        self.inflight += 1
+        submitted = time.time()
+        try:
+            future = self._pool().submit(_timed, fn, args, kwargs)
+        except Exception:
+            self.inflight -= 1
+            raise
+        # The slot is held until the pool is done with the job. Cancelling the awaiting task does not stop
+        # a job that is already running, so releasing on cancel would admit more work than the pool can take.
+        loop = asyncio.get_running_loop()
+        future.add_done_callback(lambda _: self._release_from(loop))
+        try:
+            started, finished, result = await asyncio.wrap_future(future)
+        except Exception:
+            self.failed += 1
+            raise
+        self.completed += 1
+        self.waits.append(max(started - submitted, 0.0))
+        self.runs.append(finished - started)
+        return result
+
+    def _release_from(self, loop: asyncio.AbstractEventLoop):
+        # Runs on the pool's thread; the counter belongs to the event loop.
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # Loop already closed at shutdown.
+
+    def _release(self):
+        self.inflight -= 1
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+    def stats(self) -> dict:
+        def ms(samples, q):
+            return round(float(np.percentile(samples, q)) * 1000, 2) if samples else None
+        return {
+            "workers": self.workers, "max_queue": self.max_queue, "inflight": self.inflight,
+            "completed": self.completed, "rejected": self.rejected, "failed": self.failed,
+            "wait_p50_ms": ms(self.waits, 50), "wait_p95_ms": ms(self.waits, 95),
+            "run_p50_ms": ms(self.runs, 50), "run_p95_ms": ms(self.runs, 95),
+        }
+
+# Blocking I/O and GIL-releasing C code (bcrypt, HTTP uploads) go to threads; pure-Python CPU work (PDF parsing) to processes.
+threads = BoundedExecutor("threads", "thread", EXECUTOR_THREADS, EXECUTOR_THREAD_QUEUE)
+processes = BoundedExecutor("processes", "process", EXECUTOR_PROCESSES, EXECUTOR_PROCESS_QUEUE)
+
+def shutdown_executors():
+    threads.shutdown()
+    processes.shutdown()
+
+def executor_stats() -> dict:
+    return {"threads": threads.stats(), "processes": processes.stats()}
@@ -0,0 +1,241 @@
+import os
+import time
+import uuid
+import asyncio
+from typing import Dict, Optional
+from .cache import TTLCache
+from .tools import http_client, normalize_query
+
+AI_HORDE_API_KEY = "0000000000"
+BASE_URL = "https://stablehorde.net/api/v2"
+
+HEADERS = {
+    "apikey": AI_HORDE_API_KEY,
+    "Content-Type": "application/json",
+    "Accept": "application/json",
+    "Client-Agent": "MyChatbot:1.0 (free-image-tool)",
+    "User-Agent": "MyChatbot/1.0",
+}
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 4))
+IMAGE_TIMEOUT = float(os.getenv("IMAGE_TIMEOUT", 120))
+IMAGE_POLL_MIN = float(os.getenv("IMAGE_POLL_MIN", 2))
+IMAGE_POLL_MAX = float(os.getenv("IMAGE_POLL_MAX", 20))
+IMAGE_POLL_CONCURRENCY = 8
+# Horde serves finished images from expiring storage links, so results are not kept for long.
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", 1800))
+IMAGE_CACHE_SIZE = int(os.getenv("IMAGE_CACHE_SIZE", 1000))
+
+UNAVAILABLE = "The image generation service is currently unavailable."
+TIMED_OUT = f"Image generation timed out after {IMAGE_TIMEOUT:g} seconds. The queue is currently too long."
+
+class ImageJob:
+    def __init__(self, prompt: str, key: str):
+        self.id = uuid.uuid4().hex
+        self.prompt = prompt
+        self.key = key
+        self.horde_id: Optional[str] = None
+        self.result: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.created = time.monotonic()
+        self.next_check = 0.0
+        self.waiters = 0
+
+    def finish(self, markdown: str):
+        if not self.result.done():
+            self.result.set_result(markdown)
+
+class ImageJobs:
+    """Image generation on AI Horde, off the request path.
+
+    `submit` returns a job at once; the answer arrives on `job.result`. A small pool
+    of workers sends the submissions, and a single poller then watches every pending
+    job. Each poll round checks all due jobs together. A job's next check is scheduled
+    from the `wait_time` and `queue_position` that Horde reports, clamped to
+    [IMAGE_POLL_MIN, IMAGE_POLL_MAX]. A 429 pauses the whole poller. Identical prompts
+    share one job while it runs and are answered from a cache after it succeeds.
+    """
+
+    def __init__(self, workers: int = IMAGE_WORKERS):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.pending: Dict[str, ImageJob] = {}
+        self.by_key: Dict[str, ImageJob] = {}
+        self.cache = TTLCache(IMAGE_CACHE_SIZE, IMAGE_CACHE_TTL)
+        self.tasks = []
+        # Fire-and-forget withdrawals; held here so they are not garbage-collected mid-request.
+        self.background = set()
+        self.wakeup = asyncio.Event()
+        self.paused_until = 0.0
+        self.submitted = 0
+        self.polls = 0
+        self.rate_limited = 0
+        self.completed = 0
+        self.failed = 0
+
+    def _start(self):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._submitter()) for _ in range(self.workers)]
+            self.tasks.append(asyncio.create_task(self._poller()))
+
+    def submit(self, prompt: str) -> ImageJob:
+        key = normalize_query(prompt)
+        job = self.by_key.get(key)
+        if job is None:
+            job = ImageJob(prompt, key)
+            cached = self.cache.get(key)
+            if cached:
+                job.finish(cached)
+            else:
+                self.by_key[key] = job
+                self._start()
+                self.queue.put_nowait(job)
+        job.waiters += 1
+        return job
+
+    def release(self, job: ImageJob):
+        """Drops one waiter; the Horde request is withdrawn once nobody is waiting."""
+        job.waiters -= 1
+        if job.waiters <= 0 and not job.result.done():
+            job.result.cancel()
+            self._forget(job)
+            if job.horde_id:
+                self._background(self._withdraw(job.horde_id))
+
+    def _background(self, coro):
+        task = asyncio.create_task(coro)
+        self.background.add(task)
+        task.add_done_callback(self.background.discard)
+
+    def _forget(self, job: ImageJob):
+        self.pending.pop(job.id, None)
+        if self.by_key.get(job.key) is job:
+            del self.by_key[job.key]
+
+    def _complete(self, job: ImageJob, markdown: str, ok: bool):
+        self._forget(job)
+        if ok:
+            self.completed += 1
+            self.cache.set(job.key, markdown)
+        else:
+            self.failed += 1
+        job.finish(markdown)
+
+    async def _submitter(self):
+        while True:
+            job = await self.queue.get()
+            if job.result.done():
+                continue
+            try:
+                response = await http_client().post(f"{BASE_URL}/generate/async", headers=HEADERS, timeout=60, json={
+                    "prompt": job.prompt,
+                    "params": {"width": 576, "height": 576, "steps": 20, "sampler_name": "k_euler"},
+                })
+                response.raise_for_status()
+                job.horde_id = response.json().get("id")
+            except Exception as e:
+                print(f"[AI-HORDE][ERROR] Submission failed: {e}")
+            if job.result.done():
+                # Released while the submission was in flight.
+                if job.horde_id:
+                    await self._withdraw(job.horde_id)
+                continue
+            if not job.horde_id:
+                self._complete(job, UNAVAILABLE, ok=False)
+                continue
+            self.submitted += 1
+            job.next_check = time.monotonic() + IMAGE_POLL_MIN
+            self.pending[job.id] = job
+            self.wakeup.set()
+
+    async def _poller(self):
+        slots = asyncio.Semaphore(IMAGE_POLL_CONCURRENCY)
+
+        async def check(job):
+            async with slots:
+                await self._check(job)
+
+        while True:
+            now = time.monotonic()
+            due = [job for job in self.pending.values() if job.next_check <= now] if now >= self.paused_until else []
+            if due:
+                await asyncio.gather(*(check(job) for job in due))
+                continue
+            upcoming = [job.next_check for job in self.pending.values()]
+            delay = max(min(upcoming, default=IMAGE_POLL_MAX), self.paused_until) - now
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(delay, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+    async def _check(self, job: ImageJob):
+        if job.result.done():
+            return
+        if time.monotonic() - job.created > IMAGE_TIMEOUT:
+            self._complete(job, TIMED_OUT, ok=False)
+            self._background(self._withdraw(job.horde_id))
+            return
+        self.polls += 1
+        try:
+            # `check` is Horde's lightweight progress endpoint; `status` (with the images) is fetched once, when done.
+            response = await http_client().get(f"{BASE_URL}/generate/check/{job.horde_id}", headers=HEADERS, timeout=15)
+            if response.status_code == 429:
+                self._rate_limited(response)
+                return
+            response.raise_for_status()
+            data = response.json()
+            if data.get("faulted") or data.get("is_possible") is False:
+                self._complete(job, "Generation failed. Try a simpler prompt.", ok=False)
+            elif data.get("done"):
+                await self._collect(job)
+            else:
+                hint = max(data.get("wait_time", 0) / 2, data.get("queue_position", 0) * 0.5)
+                job.next_check = time.monotonic() + min(max(hint, IMAGE_POLL_MIN), IMAGE_POLL_MAX)
+        except Exception as e:
+            print(f"[AI-HORDE][ERROR] Polling error: {e}")
+            job.next_check = time.monotonic() + IMAGE_POLL_MAX / 2
+
+    async def _collect(self, job: ImageJob):
+        response = await http_client().get(f"{BASE_URL}/generate/status/{job.horde_id}", headers=HEADERS, timeout=30)
+        if response.status_code == 429:
+            self._rate_limited(response)
+            return
+        response.raise_for_status()
+        generations = response.json().get("generations", [])
+        if generations and generations[0].get("img"):
+            self._complete(job, f"![Generated Image]({generations[0]['img']})", ok=True)
+        else:
+            self._complete(job, "Generation complete, but no image was found.", ok=False)
+
+    def _rate_limited(self, response):
+        self.rate_limited += 1
+        try:
+            retry_after = float(response.headers.get("Retry-After", IMAGE_POLL_MAX / 2))
+        except ValueError:
+            retry_after = IMAGE_POLL_MAX / 2
+        self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    async def _withdraw(self, horde_id: str):
+        try:
+            await http_client().delete(f"{BASE_URL}/generate/status/{horde_id}", headers=HEADERS)
+            print(f"[AI-HORDE] Cancelled job {horde_id}")
+        except Exception as e:
+            print(f"[AI-HORDE][ERROR] Cancel failed: {e}")
+
+    async def close(self):
+        for job in list(self.pending.values()):
+            job.result.cancel()
+            await self._withdraw(job.horde_id)
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, *self.background, return_exceptions=True)
+        self.tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.queue.qsize(), "pending": len(self.pending), "submitted": self.submitted,
+            "polls": self.polls, "rate_limited": self.rate_limited, "completed": self.completed,
+            "failed": self.failed, "cache": self.cache.stats(),
+        }
+
+image_jobs = ImageJobs()
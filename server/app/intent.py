@@ -0,0 +1,134 @@
+import os
+import re
+import zlib
+import numpy as np
+from typing import List, Optional, Sequence, Tuple
+
+LABELS = ("IMAGE", "SIMPLE", "COMPLEX")
+INTENT_CLASSIFIER = os.getenv("INTENT_CLASSIFIER", "local")  # local | llm
+INTENT_CONFIDENCE = float(os.getenv("INTENT_CONFIDENCE", 0.7))
+# A wrong IMAGE costs a Horde job and leaves the question unanswered, so the model needs more certainty for it.
+INTENT_IMAGE_CONFIDENCE = float(os.getenv("INTENT_IMAGE_CONFIDENCE", 0.9))
+INTENT_MODEL_PATH = os.getenv("INTENT_MODEL_PATH", "")
+INTENT_EXAMPLES = os.path.join(os.path.dirname(__file__), "data", "intent_examples.tsv")
+# Evaluation only (benchmarks/intent.py); never trained on.
+INTENT_HOLDOUT = os.path.join(os.path.dirname(__file__), "data", "intent_holdout.tsv")
+INTENT_FEATURE_BITS = 16
+
+# Only unmistakable requests: an imperative to draw something, or to generate "an image of"/"a picture showing" something.
+# Anything looser ("create a logo in svg", "make the image responsive") is left to the model and its IMAGE threshold.
+_IMAGE_RULE = re.compile(
+    r"^(?:please\s+)?(?:(?:can|could|would)\s+(?:you|u)\s+(?:please\s+)?)?(?:"
+    r"(?:draw|sketch|paint|illustrate)(?:\s+me)?\s+(?:a|an|some|my|two|three)\b(?!.*\b(?:what|how|why)\b)"
+    r"|(?:generate|create|make|render|produce|give me|show me)(?:\s+me)?\s+(?:(?:a|an|some)\s+)?(?:[\w-]+\s+){0,2}?"
+    r"(?:image|picture|pic|photo|drawing|illustration|painting|portrait|wallpaper|poster)s?\s+(?:of|showing|depicting)\b)",
+    re.I,
+)
+_SIMPLE_RULE = re.compile(
+    r"^(?:hi+|hello+|hey+|yo|sup|hola|namaste|bonjour|good (?:morning|afternoon|evening|night|day)|"
+    r"bye(?: bye)?|goodbye|see (?:you|ya)(?: later)?|thanks?(?: you)?(?: so much| a lot)?|thx|ty|"
+    r"ok(?:ay)?|cool|nice|great|perfect|got it|how are you(?: doing)?)(?:\s+there)?[\s!.?,]*$",
+    re.I,
+)
+_WORD = re.compile(r"[a-z0-9']+")
+
+def rules(text: str) -> Optional[str]:
+    """Unambiguous cases that need no model at all."""
+    if _SIMPLE_RULE.match(text.strip()):
+        return "SIMPLE"
+    if _IMAGE_RULE.match(text.strip()):
+        return "IMAGE"
+    return None
+
+def features(text: str, bits: int = INTENT_FEATURE_BITS) -> np.ndarray:
+    """Hashed word uni/bigrams, character 3-grams and a length bucket, as unique feature ids."""
+    words = _WORD.findall(text.lower())
+    grams = [f"w:{w}" for w in words]
+    grams += [f"b:{a} {b}" for a, b in zip(words, words[1:])]
+    for w in words:
+        padded = f"<{w}>"
+        grams += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    grams.append(f"len:{min(len(words), 12)}")
+    grams.append(f"first:{words[0]}" if words else "first:")
+    mask = (1 << bits) - 1
+    return np.unique(np.fromiter((zlib.crc32(g.encode()) & mask for g in grams), dtype=np.int64))
+
+class IntentClassifier:
+    """Multinomial logistic regression over hashed n-gram features.
+
+    Each message becomes a few dozen hashed ids, so scoring one is a single gather-and-sum
+    over the weight matrix. Training is plain SGD and takes well under a second on the
+    bundled examples.
+    """
+
+    def __init__(self, bits: int = INTENT_FEATURE_BITS):
+        self.bits = bits
+        self.weights = np.zeros((len(LABELS), 1 << bits), dtype=np.float32)
+        self.bias = np.zeros(len(LABELS), dtype=np.float32)
+
+    def _scores(self, ids: np.ndarray) -> np.ndarray:
+        logits = self.weights[:, ids].sum(axis=1) / np.sqrt(max(len(ids), 1)) + self.bias
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        probs = self._scores(features(text, self.bits))
+        best = int(np.argmax(probs))
+        return LABELS[best], float(probs[best])
+
+    def fit(self, texts: Sequence[str], labels: Sequence[str], epochs: int = 30,
+            lr: float = 0.5, l2: float = 1e-5, seed: int = 0) -> "IntentClassifier":
+        rng = np.random.default_rng(seed)
+        rows = [features(t, self.bits) for t in texts]
+        targets = np.array([LABELS.index(l) for l in labels])
+        for epoch in range(epochs):
+            step = lr / (1 + epoch * 0.2)
+            for i in rng.permutation(len(rows)):
+                ids, scale = rows[i], 1 / np.sqrt(max(len(rows[i]), 1))
+                grad = self._scores(ids)
+                grad[targets[i]] -= 1
+                self.weights[:, ids] -= step * (grad[:, None] * scale + l2 * self.weights[:, ids])
+                self.bias -= step * grad
+        return self
+
+    def save(self, path: str):
+        np.savez_compressed(path, weights=self.weights, bias=self.bias)
+
+    @classmethod
+    def load(cls, path: str) -> "IntentClassifier":
+        data = np.load(path)
+        model = cls(bits=int(np.log2(data["weights"].shape[1])))
+        model.weights, model.bias = data["weights"], data["bias"]
+        return model
+
+def load_examples(path: str = INTENT_EXAMPLES) -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            label, _, text = line.rstrip("\n").partition("\t")
+            if text:
+                texts.append(text)
+                labels.append(label)
+    return texts, labels
+
+_model: Optional[IntentClassifier] = None
+
+def get_classifier() -> IntentClassifier:
+    global _model
+    if _model is None:
+        if INTENT_MODEL_PATH and os.path.exists(INTENT_MODEL_PATH):
+            _model = IntentClassifier.load(INTENT_MODEL_PATH)
+        else:
+            _model = IntentClassifier().fit(*load_examples())
+    return _model
+
+def confident(label: str, confidence: float, threshold: float = INTENT_CONFIDENCE) -> bool:
+    """Whether a prediction can be used without asking the LLM."""
+    return confidence >= (max(threshold, INTENT_IMAGE_CONFIDENCE) if label == "IMAGE" else threshold)
+
+def classify(text: str) -> Tuple[str, float]:
+    """(label, confidence); rule matches report a confidence of 1.0."""
+    label = rules(text)
+    if label:
+        return label, 1.0
+    return get_classifier().predict(text)
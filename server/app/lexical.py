@@ -0,0 +1,85 @@
+import re
+import math
+import numpy as np
+from array import array
+from collections import Counter
+from typing import Dict, List, Sequence, Tuple
+
+_TERM = re.compile(r"[A-Za-z0-9_]+(?:[.\-:/][A-Za-z0-9_]+)*")
+_PART = re.compile(r"[A-Za-z0-9]+")
+# Error codes, snake_case / camelCase / dotted names, version strings, acronyms.
+_IDENTIFIER = re.compile(r"\d|_|[.\-:/]|[a-z][A-Z]|^[A-Z]{2,}$")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how i in is it its of on or that the this to was what when where which who why will with you your".split()
+)
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased terms; compound tokens like `ERR-404` or `user.email` are kept whole and also split into parts."""
+    terms = []
+    for match in _TERM.finditer(text):
+        token = match.group().lower()
+        if token not in _STOPWORDS:
+            terms.append(token)
+        parts = _PART.findall(token)
+        if len(parts) > 1:
+            terms.extend(p for p in parts if p not in _STOPWORDS)
+    return terms
+
+def identifiers(text: str) -> List[str]:
+    return [m.group().lower() for m in _TERM.finditer(text) if _IDENTIFIER.search(m.group())]
+
+class BM25Index:
+    """Incremental Okapi BM25 over chunk positions. Postings are parallel compact arrays
+    (uint32 doc positions, uint16 term frequencies) appended in position order."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1, self.b = k1, b
+        self.postings: Dict[str, Tuple[array, array]] = {}
+        self.doc_lengths = array("I")
+        self.total_length = 0
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, text: str):
+        position = len(self.doc_lengths)
+        terms = tokenize(text)
+        for term, tf in Counter(terms).items():
+            docs, tfs = self.postings.setdefault(term, (array("I"), array("H")))
+            docs.append(position)
+            tfs.append(min(tf, 65535))
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, int]]:
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        norm = self.k1 * (1 - self.b + self.b * lengths / (self.total_length / n))
+        scores = np.zeros(n, dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            docs = np.frombuffer(posting[0], dtype=np.uint32)
+            tfs = np.frombuffer(posting[1], dtype=np.uint16).astype(np.float32)
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm[docs])
+            del docs  # release the buffer view so the postings array can grow again
+        del lengths
+
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        k = min(top_k, len(matched))
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[str]], k: int = 60) -> List[str]:
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)
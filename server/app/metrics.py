@@ -0,0 +1,104 @@
+import bisect
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, List, Tuple
+
+# Seconds. Wide enough for a cache hit at one end and a slow provider reply at the other.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500, 1000)
+
+REGISTRY: List["Metric"] = []
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.label_names = labels
+        REGISTRY.append(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name, doc, labels=()):
+        super().__init__(name, doc, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def _samples(self):
+        return [f"{self.name}{_labels(self.label_names, key)} {value}" for key, value in self.values.items()]
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram in the Prometheus text format."""
+    kind = "histogram"
+
+    def __init__(self, name, doc, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(buckets)
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        series = self.series.get(key)
+        if series is None:
+            # Per-bucket counts, then the running sum and count.
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total, count) in self.series.items():
+            running = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                running += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{float(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {running}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {count}")
+        return lines
+
+def render_metrics() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+stage_seconds = Histogram("chat_stage_seconds", "Duration of each chat turn stage.", ("stage",))
+turn_seconds = Histogram("chat_turn_seconds", "Duration of a whole chat turn, by route (simple, complex, image) or outcome.", ("route",))
+ttft_seconds = Histogram("chat_ttft_seconds", "Time from request to first token, per provider.", ("provider",))
+generation_seconds = Histogram("chat_generation_seconds", "Time from request to last token, per provider.", ("provider",))
+tokens_per_second = Histogram("chat_tokens_per_second", "Streaming rate after the first token, per provider.",
+                              ("provider",), buckets=RATE_BUCKETS)
+embedding_seconds = Histogram("embedding_seconds", "Latency of embedding calls that miss the cache.", ("backend",))
+vector_search_seconds = Histogram("vector_search_seconds", "Latency of document retrieval.", ("backend",))
+web_search_seconds = Histogram("web_search_seconds", "Latency of each web search engine.", ("engine",))
+cache_embed_wait_seconds = Histogram("response_cache_embed_wait_seconds",
+                                     "Time a response-cache miss waited for the prompt embedding before generating.")
+db_seconds = Histogram("db_op_seconds", "Latency of MongoDB operations.", ("op",))
+errors_total = Counter("chat_errors_total", "Errors that were handled rather than raised, by where they happened.", ("where",))
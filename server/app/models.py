@@ -1,4 +1,5 @@
 from beanie import Document, PydanticObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
 from pydantic import BaseModel, Field, EmailStr
 from typing import List, Optional
 from datetime import datetime
@@ -23,6 +24,11 @@ class ChatMessage(Document):
 
     class Settings:
         name = "chat_messages"
+        indexes = [
+            # History reads, edit/regenerate truncation and the message pages all filter by session and
+            # order by time; _id breaks ties for the pagination cursor.
+            IndexModel([("session_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="session_timestamp"),
+        ]
 
 class ChatSession(Document):
     session_id: str = Field(default_factory=lambda: str(PydanticObjectId()))
@@ -30,9 +36,16 @@ class ChatSession(Document):
     title: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
+    # Rolling summary of the turns up to summary_until; later turns are sent verbatim.
+    summary: Optional[str] = None
+    summary_until: Optional[datetime] = None
 
     class Settings:
         name = "chat_sessions"
+        indexes = [
+            IndexModel([("session_id", ASCENDING)], name="session_id"),
+            IndexModel([("user_email", ASCENDING), ("updated_at", DESCENDING), ("_id", DESCENDING)], name="user_updated"),
+        ]
     
     async def save(self, *args, **kwargs):
         self.updated_at = datetime.utcnow()
@@ -50,4 +63,7 @@ class User(Document):
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
     class Settings:
-        name = "users"
\ No newline at end of file
+        name = "users"
+        indexes = [
+            IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        ]
\ No newline at end of file
@@ -0,0 +1,26 @@
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+def encode_cursor(when: datetime, doc_id) -> str:
+    return base64.urlsafe_b64encode(f"{when.isoformat()}|{doc_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        when, _, doc_id = raw.partition("|")
+        return datetime.fromisoformat(when), ObjectId(doc_id)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def before_cursor(field: str, cursor: Optional[str]) -> dict:
+    """Keyset condition for rows strictly older than `cursor` in (field, _id) descending order."""
+    if not cursor:
+        return {}
+    when, doc_id = decode_cursor(cursor)
+    return {"$or": [{field: {"$lt": when}}, {field: when, "_id": {"$lt": doc_id}}]}
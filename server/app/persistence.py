@@ -0,0 +1,182 @@
+import os
+import asyncio
+from collections import defaultdict, deque
+from datetime import datetime
+from typing import Dict, List, Optional
+from beanie import PydanticObjectId
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from .models import ChatMessage, ChatSession
+from .metrics import db_seconds, errors_total
+
+WRITE_BEHIND_MS = float(os.getenv("WRITE_BEHIND_MS", 50))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", 500))
+WRITE_BEHIND_RETRIES = 3
+DUPLICATE_KEY = 11000
+
+def only_duplicates(error: BulkWriteError) -> bool:
+    details = error.details or {}
+    write_errors = details.get("writeErrors", [])
+    return bool(write_errors) and not details.get("writeConcernErrors") and all(
+        e.get("code") == DUPLICATE_KEY for e in write_errors
+    )
+
+class WriteBehind:
+    """Takes chat writes off the latency path and applies them in the background, in order.
+
+    Queued operations are drained by a single worker every `WRITE_BEHIND_MS`. Consecutive
+    message inserts become one `insert_many`. Session field updates queued in the same
+    batch are merged into one `$set` per session and sent as a single `bulk_write`.
+    `pending_messages(session_id)` returns the messages not yet known to be stored, so
+    readers can merge them with what the database returns instead of waiting for a
+    `flush`. Message ids are assigned when a message is queued, so callers can refer to
+    it (and de-duplicate it) straight away.
+    """
+
+    def __init__(self, delay_ms: float = WRITE_BEHIND_MS, max_batch: int = WRITE_BEHIND_BATCH):
+        self.delay = delay_ms / 1000
+        self.max_batch = max_batch
+        self.queue = deque()
+        self.writing = []
+        self.pending: Dict[str, int] = defaultdict(int)
+        self.changed = asyncio.Condition()
+        self.wakeup = asyncio.Event()
+        self.worker: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.writes = 0
+        self.failures = 0
+
+    def add_message(self, message: ChatMessage) -> ChatMessage:
+        if message.id is None:
+            message.id = PydanticObjectId()
+        self._enqueue(("insert", message.session_id, message))
+        return message
+
+    def pending_messages(self, session_id: str) -> List[ChatMessage]:
+        """Queued or in-flight messages of one session, in queue order."""
+        return [payload for kind, sid, payload in (*self.writing, *self.queue) if kind == "insert" and sid == session_id]
+
+    def update_session(self, session_id: str, **fields):
+        self._enqueue(("update", session_id, fields))
+
+    def touch(self, session: ChatSession):
+        session.updated_at = datetime.utcnow()
+        self.update_session(session.session_id, updated_at=session.updated_at)
+
+    def _enqueue(self, op):
+        self.queue.append(op)
+        self.pending[op[1]] += 1
+        if self.worker is None or self.worker.done():
+            self.worker = asyncio.create_task(self._run())
+        self.wakeup.set()
+
+    async def flush(self, session_id: Optional[str] = None):
+        def done():
+            return not self.pending.get(session_id) if session_id else not self.queue and not any(self.pending.values())
+        if done():
+            return
+        self.wakeup.set()
+        async with self.changed:
+            await self.changed.wait_for(done)
+
+    async def close(self):
+        await self.flush()
+        if self.worker:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+            self.worker = None
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            if self.delay:
+                await asyncio.sleep(self.delay)
+            while self.queue:
+                batch = self.writing = [self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch))]
+                try:
+                    await self._apply(batch)
+                finally:
+                    self.writing = []
+                for _, session_id, _ in batch:
+                    self.pending[session_id] -= 1
+                    if not self.pending[session_id]:
+                        del self.pending[session_id]
+                async with self.changed:
+                    self.changed.notify_all()
+
+    async def _apply(self, batch):
+        """Applies the batch in queue order: runs of inserts, then merged session updates, alternating as queued."""
+        groups = []
+        for kind, session_id, payload in batch:
+            if not groups or groups[-1][0] != kind:
+                groups.append((kind, []))
+            groups[-1][1].append((session_id, payload))
+        for kind, items in groups:
+            if kind == "insert":
+                op, write = "insert_messages", lambda items=items: ChatMessage.insert_many([m for _, m in items], ordered=False)
+            else:
+                merged: Dict[str, dict] = {}
+                for session_id, fields in items:
+                    merged.setdefault(session_id, {}).update(fields)
+                ops = [UpdateOne({"session_id": sid}, {"$set": fields}) for sid, fields in merged.items()]
+                op, write = "update_sessions", lambda ops=ops: ChatSession.get_pymongo_collection().bulk_write(ops, ordered=False)
+            await self._write(op, write, len(items))
+        self.batches += 1
+
+    async def _write(self, op: str, write, count: int):
+        for attempt in range(WRITE_BEHIND_RETRIES):
+            try:
+                with db_seconds.time(op=op):
+                    await write()
+                self.writes += count
+                return
+            except BulkWriteError as e:
+                # A retry re-sends rows an earlier attempt already stored; those come back as duplicate keys.
+                if only_duplicates(e):
+                    self.writes += count
+                    return
+                error = e
+            except Exception as e:
+                error = e
+            print(f"[PERSIST] Write of {count} ops failed (attempt {attempt + 1}): {error}")
+            errors_total.inc(where="persistence")
+            if attempt + 1 < WRITE_BEHIND_RETRIES:
+                await asyncio.sleep(0.2 * 2 ** attempt)
+        self.failures += count
+
+    def stats(self) -> dict:
+        return {"queued": len(self.queue), "batches": self.batches, "writes": self.writes, "failures": self.failures}
+
+class ConnectionSession:
+    """A connection's ChatSession, loaded (or created) once instead of on every frame."""
+
+    def __init__(self, session_id: str, user_email: str):
+        self.session_id = session_id
+        self.user_email = user_email
+        self.session: Optional[ChatSession] = None
+        self.lock = asyncio.Lock()
+
+    async def authorize(self) -> bool:
+        """False when the session exists and belongs to another user; otherwise keeps it for `get`."""
+        with db_seconds.time(op="load_session"):
+            session = await ChatSession.find_one(ChatSession.session_id == self.session_id)
+        if session is not None and session.user_email != self.user_email:
+            return False
+        self.session = session
+        return True
+
+    async def get(self):
+        """Returns (session, created); `created` is only ever True once."""
+        async with self.lock:
+            if self.session is not None:
+                return self.session, False
+            with db_seconds.time(op="load_session"):
+                session = await ChatSession.find_one(ChatSession.session_id == self.session_id)
+            created = session is None
+            if created:
+                session = await ChatSession(session_id=self.session_id, user_email=self.user_email, title="New Chat").insert()
+            self.session = session
+            return session, created
+
+persistence = WriteBehind()
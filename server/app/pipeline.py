@@ -0,0 +1,105 @@
+import asyncio
+from time import perf_counter
+from . import tracing
+from .metrics import stage_seconds
+
+class StagePipeline:
+    """Runs the independent stages of a chat turn concurrently and records how long each took (ms).
+
+    Each stage is also a span on the current trace and a sample of `chat_stage_seconds`.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.tasks = {}
+        self.timings = {}
+
+    def start(self, name: str, coro) -> asyncio.Task:
+        task = asyncio.create_task(self._timed(name, coro))
+        self.tasks[name] = task
+        return task
+
+    async def _timed(self, name, coro):
+        start = perf_counter()
+        status = "ok"
+        try:
+            return await coro
+        except asyncio.CancelledError:
+            self.timings[name] = status = "cancelled"
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            end = perf_counter()
+            self.timings.setdefault(name, round((end - start) * 1000, 1))
+            tracing.record(name, start, end, status)
+            if status == "ok":
+                stage_seconds.observe(end - start, stage=name)
+
+    def mark(self, name: str):
+        self.timings[name] = round((perf_counter() - self.started) * 1000, 1)
+
+    def cancel(self, *names: str):
+        for name in names:
+            task = self.tasks.get(name)
+            if task and not task.done():
+                task.cancel()
+                self.timings[name] = "cancelled"
+
+    async def result(self, name: str, default=None):
+        task = self.tasks.get(name)
+        if task is None:
+            return default
+        await asyncio.wait({task})
+        if task.cancelled() or task.exception():
+            return default
+        return task.result()
+
+    def finish(self):
+        self.mark("total")
+        return self.timings
+
+class TurnScheduler:
+    """Per-connection scheduler: the socket keeps receiving while turns run as tasks.
+
+    Turns run one after another in arrival order, so replies never interleave on the
+    socket; `cancel` aborts the running turn and drops any that are still queued.
+    Work a turn leaves behind for the connection (`spawn`) is cancelled along with it.
+    """
+
+    def __init__(self):
+        self.tasks = set()
+        self.tail = None
+
+    def submit(self, turn) -> asyncio.Task:
+        """`turn` is a coroutine function, so a turn cancelled while queued is never started."""
+        previous = self.tail
+
+        async def run():
+            if previous:
+                await asyncio.wait({previous})
+            await turn()
+
+        task = asyncio.create_task(run())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        self.tail = task
+        return task
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Runs `coro` beside the turns rather than after them, still owned by this connection."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def join(self):
+        """Waits for every submitted turn, including the clean-up of cancelled ones."""
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def cancel(self) -> int:
+        pending = [t for t in self.tasks if not t.done()]
+        for task in pending:
+            task.cancel()
+        return len(pending)
@@ -0,0 +1,127 @@
+import os
+import httpx
+import google.generativeai as genai
+from groq import AsyncGroq
+from mistralai import Mistral
+from typing import AsyncIterator, List, Optional
+
+genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+
+# One keep-alive pool per vendor, shared by every model that talks to it.
+POOL_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", 500)),
+    max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", 100)),
+    keepalive_expiry=60.0,
+)
+POOL_TIMEOUT = httpx.Timeout(float(os.getenv("LLM_TIMEOUT", 60)), connect=10.0)
+
+_clients = {}
+
+def _http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(limits=POOL_LIMITS, timeout=POOL_TIMEOUT)
+
+def _groq_client() -> AsyncGroq:
+    if "groq" not in _clients:
+        _clients["groq"] = AsyncGroq(api_key=os.getenv("GROQ_API_KEY"), http_client=_http_client())
+    return _clients["groq"]
+
+def _mistral_client() -> Mistral:
+    if "mistral" not in _clients:
+        _clients["mistral"] = Mistral(api_key=os.getenv("MISTRAL_API_KEY"), async_client=_http_client())
+    return _clients["mistral"]
+
+async def close_providers():
+    groq = _clients.pop("groq", None)
+    if groq: await groq.close()
+    mistral = _clients.pop("mistral", None)
+    if mistral: await mistral.sdk_configuration.async_client.aclose()
+
+def to_chat_messages(system_prompt: Optional[str], history: List[dict], prompt: str, context: Optional[str] = None) -> List[dict]:
+    msgs = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    for h in history:
+        msgs.append({"role": "user" if h['role'] == 'user' else "assistant", "content": h['parts'][0]})
+    msgs.append({"role": "user", "content": f"CONTEXT: {context}\n\nUSER: {prompt}" if context is not None else prompt})
+    return msgs
+
+class Provider:
+    """A chat model behind a non-blocking, streaming interface.
+
+    `history` uses the Gemini shape (`{"role": "user"|"model", "parts": [text]}`)
+    produced by `get_formatted_history`; each provider converts it as needed.
+    """
+    name = "base"
+
+    def __init__(self, model: str, system_prompt: Optional[str] = None):
+        self.model = model
+        self.system_prompt = system_prompt
+
+    def stream(self, prompt: str, history: List[dict], context: Optional[str] = None) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    async def complete(self, prompt: str, max_tokens: Optional[int] = None, temperature: Optional[float] = None) -> str:
+        raise NotImplementedError
+
+class GeminiProvider(Provider):
+    name = "gemini"
+
+    def __init__(self, model: str, system_prompt: Optional[str] = None):
+        super().__init__(model, system_prompt)
+        self.client = genai.GenerativeModel(model_name=model, system_instruction=system_prompt)
+
+    async def stream(self, prompt, history, context=None):
+        chat = self.client.start_chat(history=history)
+        message = f"CONTEXT: {context}\n\nUSER: {prompt}" if context is not None else prompt
+        response_stream = await chat.send_message_async(message, stream=True)
+        async for chunk in response_stream:
+            if chunk.text:
+                yield chunk.text
+
+    async def complete(self, prompt, max_tokens=None, temperature=None):
+        config = genai.GenerationConfig(max_output_tokens=max_tokens, temperature=temperature)
+        res = await self.client.generate_content_async(prompt, generation_config=config)
+        return res.text
+
+class GroqProvider(Provider):
+    name = "groq"
+
+    async def stream(self, prompt, history, context=None):
+        msgs = to_chat_messages(self.system_prompt, history, prompt, context)
+        comp = await _groq_client().chat.completions.create(model=self.model, messages=msgs, stream=True)
+        try:
+            async for chunk in comp:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+        finally:
+            # Dropping the connection is what stops generation (and billing) upstream.
+            await comp.close()
+
+    async def complete(self, prompt, max_tokens=None, temperature=None):
+        kwargs = {k: v for k, v in {"max_tokens": max_tokens, "temperature": temperature}.items() if v is not None}
+        resp = await _groq_client().chat.completions.create(
+            model=self.model,
+            messages=to_chat_messages(self.system_prompt, [], prompt),
+            **kwargs
+        )
+        return resp.choices[0].message.content
+
+class MistralProvider(Provider):
+    name = "mistral"
+
+    async def stream(self, prompt, history, context=None):
+        msgs = to_chat_messages(self.system_prompt, history, prompt, context)
+        stream = await _mistral_client().chat.stream_async(model=self.model, messages=msgs)
+        async with stream:
+            async for chunk in stream:
+                content = chunk.data.choices[0].delta.content
+                if content:
+                    yield content
+
+    async def complete(self, prompt, max_tokens=None, temperature=None):
+        kwargs = {k: v for k, v in {"max_tokens": max_tokens, "temperature": temperature}.items() if v is not None}
+        resp = await _mistral_client().chat.complete_async(
+            model=self.model,
+            messages=to_chat_messages(self.system_prompt, [], prompt),
+            **kwargs
+        )
+        return resp.choices[0].message.content
@@ -1,80 +1,175 @@
 import os
-import asyncio
-import httpx
 from motor.motor_asyncio import AsyncIOMotorClient
-from typing import List, Optional
+from typing import AsyncIterator, List
+from .embeddings import get_backend
+from .embedding_cache import EmbeddingCache, content_key
+from .vector_index import VectorIndexRegistry
+from .chunking import token_chunks
+from .lexical import identifiers, reciprocal_rank_fusion
+from .metrics import db_seconds, embedding_seconds, errors_total, vector_search_seconds
 
 MONGO_URL = os.getenv("MONGO_URI")
 client = AsyncIOMotorClient(MONGO_URL)
 db = client.ai_chat_db
 vector_collection = db.vector_storage
 
-HF_TOKEN = os.getenv("HF_API_KEY")
-# Added explicit task routing to the URL to force Feature Extraction
-EMBEDDING_MODEL_URL = "https://router.huggingface.co/hf-inference/models/sentence-transformers/all-MiniLM-L6-v2/pipeline/feature-extraction"
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 64))
+# "token" packs sentences/paragraphs into the embedding model's window; "sliding" is the legacy 1000/800 character slicer.
+CHUNKER = os.getenv("CHUNKER", "token")
+
+# "atlas" uses the $vectorSearch stage (falling back to the in-process index if it is missing); "local" skips it.
+VECTOR_SEARCH_BACKEND = os.getenv("VECTOR_SEARCH_BACKEND", "atlas")
+ATLAS_VECTOR_INDEX = os.getenv("ATLAS_VECTOR_INDEX", "vector_index")
+ATLAS_CANDIDATES_PER_RESULT = int(os.getenv("ATLAS_CANDIDATES_PER_RESULT", 40))
+# "hybrid" fuses BM25 over the session's chunks with vector results (reciprocal-rank fusion).
+RAG_RETRIEVAL = os.getenv("RAG_RETRIEVAL", "vector")
+RAG_LEXICAL_SHORTCUT = os.getenv("RAG_LEXICAL_SHORTCUT", "true").lower() == "true"
+vector_index = VectorIndexRegistry(vector_collection, lexical=RAG_RETRIEVAL == "hybrid")
+
+EMBEDDING_CACHE_PERSIST = os.getenv("EMBEDDING_CACHE_PERSIST", "true").lower() == "true"
+embedding_cache = EmbeddingCache(db.embedding_cache if EMBEDDING_CACHE_PERSIST else None)
+
+async def ensure_vector_indexes():
+    # Session loads, has_documents and the local search all filter chunks by session.
+    await vector_collection.create_index([("session_id", 1)], name="session_id")
 
 async def get_embedding(text: str):
-    if not HF_TOKEN:
-        print("[ERROR] HF_TOKEN missing in environment variables.")
-        return None
+    return (await get_embeddings([text]))[0]
 
-    headers = {
-        "Authorization": f"Bearer {HF_TOKEN}",
-        "Content-Type": "application/json",
-        "X-Wait-For-Model": "true"
-    }
-    
-    # Payload is kept simple to avoid pipeline confusion
-    payload = {"inputs": text}
+async def get_embeddings(texts: List[str]):
+    backend = get_backend()
+    keys = [content_key(backend.model_id, t) for t in texts]
+    cached = await embedding_cache.get_many(list(dict.fromkeys(keys)))
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(EMBEDDING_MODEL_URL, headers=headers, json=payload, timeout=30.0)
-            
-            if response.status_code == 200:
-                result = response.json()
-                # Handle nested list structure from feature-extraction
-                if isinstance(result, list) and len(result) > 0:
-                    if isinstance(result[0], list): return result[0]
-                    return result
-                return result
+    # Embed each distinct uncached text once, however often it repeats in the batch.
+    missing = {k: t for k, t in zip(keys, texts) if k not in cached}
+    if missing:
+        try:
+            with embedding_seconds.time(backend=type(backend).__name__):
+                fresh = await backend.embed(list(missing.values()))
+        except Exception as e:
+            print(f"[EXCEPTION] get_embeddings: {e}")
+            errors_total.inc(where="embedding")
+            fresh = [None] * len(missing)
+        computed = {k: v for k, v in zip(missing, fresh) if v}
+        embedding_cache.put_many(backend.model_id, computed)
+        cached.update(computed)
+    return [cached.get(k) for k in keys]
+
+async def add_to_vector_db(content: str, filename: str, session_id: str, progress=None):
+    async def single():
+        yield content
+    return await ingest_stream(single(), filename, session_id, progress)
+
+async def sliding_chunks(texts: AsyncIterator[str], size: int = 1000, step: int = 800):
+    buffer, pos = "", 0
+    async for text in texts:
+        buffer = buffer[pos:] + text
+        pos = 0
+        while len(buffer) - pos >= size:
+            yield buffer[pos:pos + size]
+            pos += step
+    while pos < len(buffer):
+        yield buffer[pos:pos + size]
+        pos += step
+
+async def ingest_stream(texts: AsyncIterator[str], filename: str, session_id: str, progress=None) -> int:
+    """Chunk a stream of text as it arrives, embed it in bounded batches and bulk-insert each batch.
+    `progress(chunks_saved)` is awaited after every batch. Returns the number of chunks stored."""
+    saved, index, batch = 0, 0, []
+
+    async def flush():
+        nonlocal saved, index
+        embeddings = await get_embeddings(batch)
+        docs = []
+        for chunk, embedding in zip(batch, embeddings):
+            if embedding:
+                docs.append({
+                    "session_id": session_id,
+                    "filename": filename,
+                    "chunk_index": index,
+                    "content": chunk,
+                    "embedding": embedding
+                })
             else:
-                print(f"[ERROR] HF Embedding failed: {response.status_code} - {response.text}")
-                return None
-    except Exception as e:
-        print(f"[EXCEPTION] get_embedding: {e}")
-        return None
+                print(f"[SKIP] Embedding failed for chunk {index}")
+            index += 1
+        saved += await save_chunks(session_id, docs)
+        batch.clear()
+        if progress:
+            await progress(saved)
 
-async def add_to_vector_db(content: str, filename: str, session_id: str):
-    chunks = [content[i:i+1000] for i in range(0, len(content), 800)]
-    tasks = [process_and_save_chunk(chunk, filename, session_id, i) for i, chunk in enumerate(chunks)]
-    await asyncio.gather(*tasks)
-
-async def process_and_save_chunk(chunk: str, filename: str, session_id: str, index: int):
-    embedding = await get_embedding(chunk)
-    if embedding:
-        doc = {
-            "session_id": session_id,
-            "filename": filename,
-            "chunk_index": index,
-            "content": chunk,
-            "embedding": embedding
-        }
-        await vector_collection.insert_one(doc)
-    else:
-        print(f"[SKIP] Embedding failed for chunk {index}")
+    chunks = token_chunks(texts) if CHUNKER == "token" else sliding_chunks(texts)
+    async for chunk in chunks:
+        batch.append(chunk)
+        if len(batch) >= INGEST_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return saved
+
+async def save_chunks(session_id: str, docs: List[dict]) -> int:
+    if not docs:
+        return 0
+    await vector_collection.insert_many(docs, ordered=False)
+    await vector_index.add(session_id, docs)
+    return len(docs)
 
 async def search_vector_db(session_id: str, query: str, top_k: int = 5):
+    lexical = None
+    if RAG_RETRIEVAL == "hybrid":
+        try:
+            with vector_search_seconds.time(backend="lexical"):
+                lexical = [c for _, c in (await vector_index.get(session_id)).lexical_search(query, top_k * 4)]
+            if RAG_LEXICAL_SHORTCUT and answers_lookup(query, lexical[:top_k]):
+                return "\n---\n".join(lexical[:top_k])
+        except Exception as e:
+            print(f"[LEXICAL INDEX ERROR]: {e}")
+
     query_embedding = await get_embedding(query)
-    if not query_embedding: return "RAG: Search skipped due to embedding error."
+    if not query_embedding:
+        if lexical: return "\n---\n".join(lexical[:top_k])
+        return "RAG: Search skipped due to embedding error."
+
+    # When fusing, pull a deeper vector list so RRF has something to re-rank.
+    depth = top_k * 4 if lexical else top_k
+    results = None
+    if VECTOR_SEARCH_BACKEND == "atlas":
+        with vector_search_seconds.time(backend="atlas"):
+            results = await search_atlas(session_id, query_embedding, depth)
+    if results is None:
+        try:
+            with vector_search_seconds.time(backend="local"):
+                results = [content for _, content in await vector_index.search(session_id, query_embedding, depth)]
+        except Exception as e:
+            print(f"[VECTOR INDEX ERROR]: {e}")
+            errors_total.inc(where="vector_search")
+            return None
+    if lexical:
+        results = reciprocal_rank_fusion([results, lexical])[:top_k]
     
+    return "\n---\n".join(results) if results else "RAG: No relevant local documents found."
+
+def answers_lookup(query: str, hits: List[str]) -> bool:
+    # Identifier-style queries (error codes, names with digits/underscores/dots) whose every
+    # identifier appears in a lexical hit are answered without embedding the query.
+    wanted = identifiers(query)
+    if not wanted or not hits:
+        return False
+    return all(any(w in h.lower() for h in hits) for w in wanted)
+
+async def has_documents(session_id: str) -> bool:
+    with db_seconds.time(op="has_documents"):
+        return await vector_collection.find_one({"session_id": session_id}, {"_id": 1}) is not None
+
+async def search_atlas(session_id: str, query_embedding: List[float], top_k: int):
     pipeline = [
         {
             "$vectorSearch": {
-                "index": "vector_index", 
+                "index": ATLAS_VECTOR_INDEX, 
                 "path": "embedding",
                 "queryVector": query_embedding,
-                "numCandidates": 100,
+                "numCandidates": max(100, top_k * ATLAS_CANDIDATES_PER_RESULT),
                 "limit": top_k,
                 "filter": {"session_id": {"$eq": session_id}}
             }
@@ -92,7 +187,6 @@ async def search_vector_db(session_id: str, query: str, top_k: int = 5):
         async for doc in vector_collection.aggregate(pipeline):
             results.append(doc["content"])
     except Exception as e:
-        print(f"[MONGODB ERROR]: {e}")
+        print(f"[MONGODB ERROR] $vectorSearch unavailable, using in-process index: {e}")
         return None
-    
-    return "\n---\n".join(results) if results else "RAG: No relevant local documents found."
\ No newline at end of file
+    return results
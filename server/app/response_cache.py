@@ -0,0 +1,133 @@
+import os
+import asyncio
+import numpy as np
+from time import perf_counter
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from .cache import TTLCache
+from .tools import normalize_query
+from .rag import get_embedding
+from .metrics import cache_embed_wait_seconds
+
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "false").lower() == "true"
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 2000))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", 0.95))
+# How long a miss on the exact key waits for the prompt embedding before generating anyway.
+RESPONSE_CACHE_EMBED_TIMEOUT_MS = float(os.getenv("RESPONSE_CACHE_EMBED_TIMEOUT_MS", 150))
+
+class ResponseCache:
+    """Finished LLM answers keyed by (route, normalized prompt, context fingerprint).
+
+    Exact repeats are TTL/LRU entries in a `TTLCache`. For near-duplicates ("what is X?"
+    vs "what's X"), prompt embeddings are kept per (route, fingerprint) bucket. A miss on
+    the exact key falls back to the most similar cached prompt with the same route and
+    fingerprint, if its cosine similarity reaches `RESPONSE_CACHE_SIMILARITY`. The miss waits
+    at most `RESPONSE_CACHE_EMBED_TIMEOUT_MS` for that embedding; a slower one keeps running
+    alongside generation and is indexed when it lands.
+    """
+
+    def __init__(self, max_size: int = RESPONSE_CACHE_SIZE, ttl: float = RESPONSE_CACHE_TTL,
+                 similarity: float = RESPONSE_CACHE_SIMILARITY, embed_timeout_ms: float = RESPONSE_CACHE_EMBED_TIMEOUT_MS):
+        self.entries = TTLCache(max_size, ttl)
+        self.similarity = similarity
+        self.embed_timeout = embed_timeout_ms / 1000
+        self.embedding_tasks = set()
+        self.embed_timeouts = 0
+        self.buckets: Dict[Tuple[str, str], "OrderedDict[tuple, np.ndarray]"] = {}
+        self.vectors = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(route: str, prompt: str, context_fp: str) -> tuple:
+        return (route, normalize_query(prompt), context_fp)
+
+    async def lookup(self, route: str, prompt: str, context_fp: str):
+        """Returns (cached answer or None, prompt embedding or None); the embedding is reused by `store`.
+        The embedding may still be an unfinished task if it missed the timeout."""
+        answer = self.entries.get(self.key(route, prompt, context_fp))
+        if answer is not None:
+            return answer, None
+        vector = None
+        if self.similarity <= 1:
+            vector = asyncio.create_task(get_embedding(normalize_query(prompt)))
+            self.embedding_tasks.add(vector)
+            vector.add_done_callback(self.embedding_tasks.discard)
+            start = perf_counter()
+            await asyncio.wait({vector}, timeout=self.embed_timeout)
+            cache_embed_wait_seconds.observe(perf_counter() - start)
+            if not vector.done():
+                self.embed_timeouts += 1
+            elif not vector.cancelled() and vector.exception() is None:
+                vector = vector.result()
+                if vector is not None:
+                    answer = self._nearest(route, context_fp, vector)
+            else:
+                vector = None
+        if answer is None:
+            self.misses += 1
+        else:
+            self.semantic_hits += 1
+        return answer, vector
+
+    def _nearest(self, route: str, context_fp: str, vector) -> Optional[str]:
+        bucket = self._prune((route, context_fp))
+        if not bucket:
+            return None
+        keys = list(bucket)
+        scores = np.stack(list(bucket.values())) @ _unit(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < self.similarity:
+            return None
+        return self.entries.get(keys[best])
+
+    def _prune(self, bucket_key: tuple):
+        """Drops prompts whose answers have expired or been evicted from the LRU."""
+        bucket = self.buckets.get(bucket_key)
+        if bucket is None:
+            return None
+        for key in [k for k in bucket if k not in self.entries]:
+            del bucket[key]
+            self.vectors -= 1
+        if not bucket:
+            del self.buckets[bucket_key]
+        return bucket
+
+    def store(self, route: str, prompt: str, context_fp: str, response: str, vector=None, cost: float = 0.0):
+        key = self.key(route, prompt, context_fp)
+        self.entries.set(key, response, cost=cost)
+        if isinstance(vector, asyncio.Future):
+            vector.add_done_callback(lambda task: self._index_later(route, context_fp, key, task))
+        elif vector is not None:
+            self._index(route, context_fp, key, vector)
+
+    def _index_later(self, route: str, context_fp: str, key: tuple, task: asyncio.Future):
+        if not task.cancelled() and task.exception() is None and task.result() is not None:
+            self._index(route, context_fp, key, task.result())
+
+    def _index(self, route: str, context_fp: str, key: tuple, vector):
+        bucket = self.buckets.setdefault((route, context_fp), OrderedDict())
+        if key not in bucket:
+            self.vectors += 1
+        bucket[key] = _unit(vector)
+        if self.vectors > 2 * self.entries.max_size:
+            for bucket_key in list(self.buckets):
+                self._prune(bucket_key)
+
+    def stats(self) -> dict:
+        hits = self.entries.hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self.entries.entries),
+            "hits": hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "embed_timeouts": self.embed_timeouts,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "saved_seconds": round(self.entries.saved_seconds, 3),
+        }
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    return v / max(float(np.linalg.norm(v)), 1e-9)
@@ -0,0 +1,261 @@
+import os
+import asyncio
+from collections import deque
+from time import monotonic, perf_counter
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+from .providers import Provider
+from .streaming import StreamWriter
+from .chunking import count_tokens
+from .metrics import errors_total, generation_seconds, tokens_per_second, ttft_seconds
+from . import tracing
+
+ROUTER_STRATEGY = os.getenv("ROUTER_STRATEGY", "latency")  # latency | ordered
+ROUTER_PREFERENCE_MS = float(os.getenv("ROUTER_PREFERENCE_MS", 250))
+ROUTER_HEDGE_MS = float(os.getenv("ROUTER_HEDGE_MS", 0))  # 0 disables hedging
+ROUTER_WINDOW = int(os.getenv("ROUTER_WINDOW", 50))
+ROUTER_WINDOW_SECONDS = float(os.getenv("ROUTER_WINDOW_SECONDS", 300))
+ROUTER_MIN_SAMPLES = int(os.getenv("ROUTER_MIN_SAMPLES", 5))
+ROUTER_ERROR_RATE = float(os.getenv("ROUTER_ERROR_RATE", 0.5))
+ROUTER_FAILURE_STREAK = int(os.getenv("ROUTER_FAILURE_STREAK", 3))
+ROUTER_COOLDOWN = float(os.getenv("ROUTER_COOLDOWN", 30))
+ROUTER_COOLDOWN_MAX = float(os.getenv("ROUTER_COOLDOWN_MAX", 300))
+
+class StreamResult(NamedTuple):
+    """What `ProviderRouter.stream` produced. `complete` is False when the client went away mid-reply."""
+    text: str
+    provider: str
+    complete: bool
+
+async def _next(chunks):
+    return await anext(chunks, "")
+
+class ProviderHealth:
+    """Rolling outcomes and time-to-first-token for one provider/model, plus its circuit breaker.
+
+    The breaker opens after `ROUTER_FAILURE_STREAK` consecutive failures, or when the
+    error rate over the window passes `ROUTER_ERROR_RATE`. Once the cooldown has passed,
+    one probe request is let through (half-open). If the probe succeeds the breaker closes;
+    if it fails the breaker reopens with double the cooldown.
+    """
+
+    def __init__(self, key: str):
+        self.key = key
+        self.outcomes = deque(maxlen=ROUTER_WINDOW)  # (time, ok)
+        self.ttft = None  # EWMA, seconds
+        self.ttft_at = 0.0
+        self.streak = 0
+        self.state = "closed"
+        self.opened_at = 0.0
+        self.cooldown = ROUTER_COOLDOWN
+        self.probing = False
+
+    def error_rate(self) -> float:
+        horizon = monotonic() - ROUTER_WINDOW_SECONDS
+        recent = [ok for t, ok in self.outcomes if t >= horizon]
+        if len(recent) < ROUTER_MIN_SAMPLES:
+            return 0.0
+        return 1 - sum(recent) / len(recent)
+
+    def available(self) -> bool:
+        if self.state == "open" and monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open":
+            return not self.probing
+        return self.state == "closed"
+
+    def acquire(self):
+        if self.state == "half_open":
+            self.probing = True
+
+    def record_ttft(self, seconds: float):
+        self.ttft = seconds if self.ttft is None or self.stale() else 0.8 * self.ttft + 0.2 * seconds
+        self.ttft_at = monotonic()
+
+    def stale(self) -> bool:
+        return monotonic() - self.ttft_at > ROUTER_WINDOW_SECONDS
+
+    def current_ttft(self) -> Optional[float]:
+        """The TTFT estimate, or None once it is older than the window and should be re-measured."""
+        return None if self.ttft is None or self.stale() else self.ttft
+
+    def record(self, ok: bool):
+        self.outcomes.append((monotonic(), ok))
+        self.probing = False
+        if ok:
+            self.streak = 0
+            if self.state != "closed":
+                print(f"[ROUTER] {self.key} recovered, closing breaker")
+            self.state, self.cooldown = "closed", ROUTER_COOLDOWN
+            return
+        self.streak += 1
+        if self.state == "half_open":
+            self._open(min(self.cooldown * 2, ROUTER_COOLDOWN_MAX))
+        elif self.state == "closed" and (self.streak >= ROUTER_FAILURE_STREAK or self.error_rate() >= ROUTER_ERROR_RATE):
+            self._open(ROUTER_COOLDOWN)
+
+    def _open(self, cooldown: float):
+        self.state, self.opened_at, self.cooldown = "open", monotonic(), cooldown
+        print(f"[ROUTER] {self.key} failing, breaker open for {cooldown:.0f}s")
+
+    def stats(self) -> dict:
+        return {
+            "state": self.state,
+            "error_rate": round(self.error_rate(), 3),
+            "ttft_ms": round(self.ttft * 1000, 1) if self.ttft is not None else None,
+            "samples": len(self.outcomes),
+        }
+
+class ProviderRouter:
+    """Streams a reply from the best available provider out of a preference list.
+
+    With the "latency" strategy, healthy providers are ranked by their smoothed
+    time-to-first-token. Each step down the preference list adds `ROUTER_PREFERENCE_MS`
+    to a provider's score, so a less preferred provider only wins when it is clearly
+    faster. An estimate older than `ROUTER_WINDOW_SECONDS` counts as unmeasured, so a
+    provider that lost the ranking after a slow reply is tried again and re-measured.
+    Providers with an open breaker are skipped. If every provider is open they are all
+    tried anyway, in preference order. With `hedge_ms`, the next candidate is started
+    when the first has not produced a token by that deadline. The first one to produce
+    a token wins and the other stream is closed.
+    """
+
+    def __init__(self, strategy: str = ROUTER_STRATEGY, hedge_ms: float = ROUTER_HEDGE_MS,
+                 preference_ms: float = ROUTER_PREFERENCE_MS):
+        self.strategy = strategy
+        self.hedge_after = hedge_ms / 1000 if hedge_ms > 0 else None
+        self.preference = preference_ms / 1000
+        self.health: Dict[str, ProviderHealth] = {}
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _health(self, provider: Provider) -> ProviderHealth:
+        key = f"{provider.name}:{provider.model}"
+        if key not in self.health:
+            self.health[key] = ProviderHealth(key)
+        return self.health[key]
+
+    def rank(self, providers: Sequence[Provider]) -> List[Provider]:
+        healthy = [p for p in providers if self._health(p).available()]
+        if not healthy:
+            return list(providers)
+        if self.strategy != "latency":
+            return healthy
+        def score(p):
+            # Unmeasured providers sort first so they get a sample.
+            ttft = self._health(p).current_ttft()
+            return (ttft is not None, (ttft or 0.0) + providers.index(p) * self.preference)
+        return sorted(healthy, key=score)
+
+    async def stream(self, providers: Sequence[Provider], prompt: str, fit: Callable[[Provider], Tuple[List[dict], str]],
+                     writer: StreamWriter, on_fallback: Optional[Callable[[Provider], Awaitable[None]]] = None) -> Optional[StreamResult]:
+        """Relays the reply into `writer` and returns it as a StreamResult, or None when every provider failed.
+        If a provider fails mid-stream, the client is told to discard what it showed before the next one starts.
+        `fit(provider)` returns the (history, context) to send to that provider."""
+        queue = self.rank(providers)
+        parts = []
+        while queue:
+            winner = await self._first_token(queue, prompt, fit, on_fallback)
+            if winner is None:
+                break
+            provider, chunks, first, started = winner
+            first_at = perf_counter()
+            health = self._health(provider)
+            try:
+                if first:
+                    parts.append(first)
+                    await writer.write(first)
+                async for content in chunks:
+                    if writer.closed:
+                        break
+                    parts.append(content)
+                    await writer.write(content)
+            except asyncio.CancelledError:
+                health.probing = False
+                raise
+            except Exception as e:
+                print(f"[ROUTER] {health.key} failed mid-stream: {e}")
+                errors_total.inc(where="provider")
+                tracing.record(f"generate:{provider.name}", started, status="error")
+                health.record(False)
+                # The next provider starts its reply from scratch; take the half-finished one back.
+                parts = []
+                await writer.discard()
+                if queue and on_fallback:
+                    await on_fallback(provider)
+                continue
+            finally:
+                await chunks.aclose()
+            health.record(True)
+            text = "".join(parts)
+            self._observe(provider, started, first_at, text)
+            return StreamResult(text, provider.name, not writer.closed)
+        return None
+
+    async def _first_token(self, queue: List[Provider], prompt, fit, on_fallback=None):
+        """Starts candidates from `queue` (hedging if configured) until one yields a first token.
+
+        Returns (provider, stream, first_token, started), or None once the queue is exhausted.
+        """
+        racing = {}
+
+        def launch():
+            provider = queue.pop(0)
+            self._health(provider).acquire()
+            chunks = provider.stream(prompt, *fit(provider))
+            racing[asyncio.create_task(_next(chunks))] = (provider, chunks, perf_counter())
+
+        launch()
+        primary = next(iter(racing.values()))[0]
+        hedged = False
+        try:
+            while racing:
+                deadline = self.hedge_after if self.hedge_after and queue and not hedged else None
+                done, _ = await asyncio.wait(racing, timeout=deadline, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    provider, chunks, started = racing.pop(task)
+                    health = self._health(provider)
+                    if task.exception() is None:
+                        ttft = perf_counter() - started
+                        health.record_ttft(ttft)
+                        ttft_seconds.observe(ttft, provider=provider.name)
+                        tracing.record(f"ttft:{provider.name}", started, started + ttft)
+                        if hedged and provider is not primary:
+                            self.hedge_wins += 1
+                        return provider, chunks, task.result(), started
+                    print(f"[ROUTER] {health.key} failed: {task.exception()}")
+                    errors_total.inc(where="provider")
+                    tracing.record(f"ttft:{provider.name}", started, status="error")
+                    health.record(False)
+                    await chunks.aclose()
+                if not racing and queue:
+                    if on_fallback:
+                        await on_fallback(provider)
+                    launch()
+            return None
+        finally:
+            for task, (provider, chunks, _) in racing.items():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                await chunks.aclose()
+                self._health(provider).probing = False
+
+    @staticmethod
+    def _observe(provider: Provider, started: float, first_at: float, text: str):
+        end = perf_counter()
+        generation_seconds.observe(end - started, provider=provider.name)
+        tracing.record(f"generate:{provider.name}", started, end)
+        if end - first_at > 0.05:
+            tokens_per_second.observe(count_tokens(text) / (end - first_at), provider=provider.name)
+
+    def stats(self) -> dict:
+        return {
+            "strategy": self.strategy,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "providers": {key: h.stats() for key, h in self.health.items()},
+        }
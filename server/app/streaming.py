@@ -0,0 +1,97 @@
+import os
+import json
+import asyncio
+from fastapi import WebSocket
+
+STREAM_FLUSH_MS = float(os.getenv("STREAM_FLUSH_MS", 30))
+STREAM_FLUSH_BYTES = int(os.getenv("STREAM_FLUSH_BYTES", 512))
+
+class StreamWriter:
+    """Per-connection socket writer that coalesces streamed tokens into fewer frames.
+
+    Chunk text is buffered and flushed once it reaches `flush_bytes` or has waited
+    `flush_ms`, whichever comes first. Any other message flushes the buffer before it is
+    sent, so ordering is preserved. With `compact`, chunk frames are sent as raw UTF-8
+    binary frames instead of `{"type": "chunk"}` JSON.
+    """
+
+    def __init__(self, websocket: WebSocket, compact: bool = False,
+                 flush_ms: float = STREAM_FLUSH_MS, flush_bytes: int = STREAM_FLUSH_BYTES):
+        self.websocket = websocket
+        self.compact = compact
+        self.flush_interval = flush_ms / 1000
+        self.flush_bytes = flush_bytes
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.timer = None
+        self.closed = False
+        self.lock = asyncio.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.chunks_in = 0
+        self.frames = 0
+        self.bytes_out = 0
+        self.streamed = []
+
+    def streamed_text(self) -> str:
+        """Everything written since the last `reset_stats`, i.e. what the client has been shown this turn."""
+        return "".join(self.streamed)
+
+    def stats(self) -> dict:
+        return {"chunks": self.chunks_in, "frames": self.frames, "bytes": self.bytes_out}
+
+    async def write(self, content: str):
+        self.buffer.append(content)
+        self.streamed.append(content)
+        self.buffered_bytes += len(content.encode("utf-8"))
+        self.chunks_in += 1
+        if self.buffered_bytes >= self.flush_bytes:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.flush_interval, self._flush_later)
+
+    def _flush_later(self):
+        self.timer = None
+        asyncio.create_task(self.flush())
+
+    async def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        async with self.lock:
+            if not self.buffer:
+                return
+            text = "".join(self.buffer)
+            self.buffer, self.buffered_bytes = [], 0
+            try:
+                if self.compact:
+                    payload = text.encode("utf-8")
+                    await self.websocket.send_bytes(payload)
+                else:
+                    payload = json.dumps({"type": "chunk", "content": text})
+                    await self.websocket.send_text(payload)
+            except Exception:
+                # Client is gone; let the producer notice via `closed` instead of raising mid-stream.
+                self.closed = True
+                return
+            self.frames += 1
+            self.bytes_out += len(payload)
+
+    async def discard(self):
+        """Drops this turn's streamed text, sent or not, and tells the client to clear it too."""
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.buffer, self.buffered_bytes, self.streamed = [], 0, []
+        try:
+            await self.send_text(json.dumps({"type": "discard"}))
+        except Exception:
+            self.closed = True
+
+    async def send_text(self, data: str):
+        await self.flush()
+        async with self.lock:
+            await self.websocket.send_text(data)
+            self.frames += 1
+            self.bytes_out += len(data)
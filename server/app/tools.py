@@ -1,116 +1,78 @@
 import os
 import asyncio
-import uuid
 import httpx
-import random
-import urllib.parse
 from ddgs import DDGS
+from .cache import TTLCache
+from .metrics import web_search_seconds
+
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 900))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 5000))
+search_cache = TTLCache(SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL)
+
+_client = None
+
+def http_client() -> httpx.AsyncClient:
+    """The shared outbound HTTP client (search engines, AI Horde); closed by `close_tools`."""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(limits=httpx.Limits(max_connections=100, max_keepalive_connections=20))
+    return _client
+
+async def close_tools():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+class SearchFailed(Exception):
+    """A search engine could not answer; the message stands in for its results."""
 
 async def search_google_serper(query: str):
     url = "https://google.serper.dev/search"
     api_key = os.getenv("SERPER_API_KEY")
     if not api_key:
-        return "Google Search Error: Missing SERPER_API_KEY"
+        raise SearchFailed("Google Search Error: Missing SERPER_API_KEY")
     headers = {"X-API-KEY": api_key, "Content-Type": "application/json"}
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json={"q": query}, headers=headers, timeout=10.0)
-            response.raise_for_status()
-            data = response.json()
+        with web_search_seconds.time(engine="google"):
+            response = await http_client().post(url, json={"q": query}, headers=headers, timeout=10.0)
+        response.raise_for_status()
+        data = response.json()
         results = data.get("organic", [])[:3]
         if not results: return "Google: No results found."
         return "\n".join(f"- {r.get('title')}: {r.get('snippet')} (Source: {r.get('link')})" for r in results)
     except Exception as e:
-        return f"Google Search Error: {str(e)}"
+        raise SearchFailed(f"Google Search Error: {str(e)}") from e
 
 async def search_ddg_async(query: str):
     def _search():
         with DDGS() as ddgs:
             return list(ddgs.text(query, max_results=3))
     try:
-        results = await asyncio.to_thread(_search)
+        with web_search_seconds.time(engine="duckduckgo"):
+            results = await asyncio.to_thread(_search)
         if not results: return "DuckDuckGo: No results found."
         return "\n".join(f"- {r.get('title')}: {r.get('body')} (Source: {r.get('href')})" for r in results)
     except Exception as e:
-        return f"DuckDuckGo Error: {str(e)}"
+        raise SearchFailed(f"DuckDuckGo Error: {str(e)}") from e
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split()).strip(" ?!.")
 
 async def search_web_consensus(query: str):
+    try:
+        return await search_cache.get_or_compute(normalize_query(query), lambda: _search_web_consensus(query))
+    except SearchFailed as e:
+        # Every engine failed; nothing was cached, so the next request tries them again.
+        return str(e)
+
+async def _search_web_consensus(query: str):
     google_res, ddg_res = await asyncio.gather(
         search_google_serper(query),
         search_ddg_async(query),
         return_exceptions=True
     )
-    return f"### GOOGLE\n{google_res}\n\n### DUCKDUCKGO\n{ddg_res}"
-
-AI_HORDE_API_KEY = "0000000000"
-BASE_URL = "https://stablehorde.net/api/v2"
-
-HEADERS = {
-    "apikey": AI_HORDE_API_KEY,
-    "Content-Type": "application/json",
-    "Accept": "application/json",
-    "Client-Agent": "MyChatbot:1.0 (free-image-tool)",
-    "User-Agent": "MyChatbot/1.0",
-}
-
-async def generate_image_tool(prompt: str) -> str | None:
-    print("[AI-HORDE] Starting image generation")
-    start_time = asyncio.get_event_loop().time()
-    timeout_limit = 120  # Strict 2 minute limit
-
-    try:
-        async with httpx.AsyncClient(timeout=60) as client:
-            try:
-                submit = await client.post(
-                    f"{BASE_URL}/generate/async",
-                    headers=HEADERS,
-                    json={
-                        "prompt": prompt,
-                        "params": {
-                            "width": 576,
-                            "height": 576,
-                            "steps": 20,
-                            "sampler_name": "k_euler",
-                        },
-                    },
-                )
-                submit.raise_for_status()
-                job_id = submit.json().get("id")
-                if not job_id:
-                    return "I am unable to start the image generation right now."
-            except Exception as e:
-                print(f"[AI-HORDE][ERROR] Submission failed: {e}")
-                return "The image generation service is currently unavailable."
-
-            while (asyncio.get_event_loop().time() - start_time) < timeout_limit:
-                try:
-                    status = await client.get(
-                        f"{BASE_URL}/generate/status/{job_id}",
-                        headers=HEADERS,
-                    )
-
-                    if status.status_code == 429:
-                        await asyncio.sleep(10)
-                        continue
-
-                    status.raise_for_status()
-                    data = status.json()
-
-                    if data.get("done"):
-                        generations = data.get("generations", [])
-                        if generations and generations[0].get("img"):
-                            image_url = generations[0].get("img")
-                            return f"![Generated Image]({image_url})"
-                        return "Generation complete, but no image was found."
-
-                    await asyncio.sleep(5)
-
-                except Exception as e:
-                    print(f"[AI-HORDE][ERROR] Polling error: {e}")
-                    await asyncio.sleep(5)
-
-            return "Image generation timed out after 2 minutes. The queue is currently too long."
-
-    except Exception as global_e:
-        print(f"[CRITICAL ERROR] {global_e}")
-        return "An unexpected error occurred during image generation."
\ No newline at end of file
+    combined = f"### GOOGLE\n{google_res}\n\n### DUCKDUCKGO\n{ddg_res}"
+    if isinstance(google_res, Exception) and isinstance(ddg_res, Exception):
+        raise SearchFailed(combined)
+    return combined
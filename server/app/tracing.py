@@ -0,0 +1,79 @@
+import os
+import uuid
+import asyncio
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+
+TRACE_BUFFER = int(os.getenv("TRACE_BUFFER", 200))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", 10000))
+
+current_trace: ContextVar[Optional["Trace"]] = ContextVar("current_trace", default=None)
+recent: "OrderedDict[str, Trace]" = OrderedDict()
+
+class Trace:
+    """Spans of one chat message, from the moment the socket received it.
+
+    `activate()` makes the trace current. Tasks created inside that block (the turn,
+    and the stages the turn starts) copy the context, so `span()` and `record()`
+    anywhere below attach to this trace without passing it around.
+    """
+
+    def __init__(self, trace_id: Optional[str] = None, **attrs):
+        self.id = (trace_id or uuid.uuid4().hex)[:64]
+        self.attrs = attrs
+        self.started = perf_counter()
+        self.spans = []
+        self.total_ms = None
+
+    def record(self, name: str, start: float, end: float, status: str = "ok", **attrs):
+        span = {"name": name, "start_ms": round((start - self.started) * 1000, 1),
+                "duration_ms": round((end - start) * 1000, 1), "status": status}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    @contextmanager
+    def activate(self):
+        token = current_trace.set(self)
+        try:
+            yield self
+        finally:
+            current_trace.reset(token)
+
+    def finish(self):
+        self.total_ms = round((perf_counter() - self.started) * 1000, 1)
+        recent[self.id] = self
+        recent.move_to_end(self.id)
+        while len(recent) > TRACE_BUFFER:
+            recent.popitem(last=False)
+        if self.total_ms > TRACE_SLOW_MS:
+            slowest = max(self.spans, key=lambda s: s["duration_ms"], default=None)
+            print(f"[TRACE] {self.id} took {self.total_ms:.0f}ms; slowest span: {slowest}")
+
+    def to_dict(self) -> dict:
+        return {"trace_id": self.id, "total_ms": self.total_ms, **self.attrs, "spans": self.spans}
+
+def trace_id() -> Optional[str]:
+    trace = current_trace.get()
+    return trace.id if trace else None
+
+def record(name: str, start: float, end: Optional[float] = None, status: str = "ok", **attrs):
+    """Adds a span (perf_counter start/end) to the current trace, if there is one."""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.record(name, start, perf_counter() if end is None else end, status, **attrs)
+
+@contextmanager
+def span(name: str, **attrs):
+    start = perf_counter()
+    status = "ok"
+    try:
+        yield
+    except BaseException as e:
+        status = "cancelled" if isinstance(e, asyncio.CancelledError) else "error"
+        raise
+    finally:
+        record(name, start, status=status, **attrs)
@@ -1,8 +1,17 @@
 import os
+import re
+import uuid
+import time
+import shutil
+import asyncio
+import tempfile
+from collections import OrderedDict
+from typing import Optional
 import cloudinary
 import cloudinary.uploader
 from fastapi import UploadFile
 import PyPDF2
+from .executors import ExecutorBusy, processes, threads
 
 cloudinary.config( 
   cloud_name = os.getenv("CLOUDINARY_CLOUD_NAME"), 
@@ -11,35 +20,123 @@ cloudinary.config(
   secure = True
 )
 
+INGEST_DIR = os.getenv("INGEST_DIR", os.path.join(tempfile.gettempdir(), "ai_chat_ingest"))
+# Uploaded PDFs that were never sent (or whose ingest died with the process) are swept after this many seconds.
+INGEST_TTL = float(os.getenv("INGEST_TTL", 3600))
+INGEST_SWEEP_INTERVAL = float(os.getenv("INGEST_SWEEP_INTERVAL", 600))
+
+def ingest_path(file_id: str) -> str:
+    if not re.fullmatch(r"[0-9a-f]{32}", file_id or ""):
+        raise ValueError("Invalid file id")
+    return os.path.join(INGEST_DIR, f"{file_id}.pdf")
+
+def sweep_ingest_dir(ttl: float = INGEST_TTL) -> int:
+    """Deletes stored PDFs older than `ttl` seconds; returns how many went."""
+    cutoff, removed = time.time() - ttl, 0
+    try:
+        entries = list(os.scandir(INGEST_DIR))
+    except FileNotFoundError:
+        return 0
+    for entry in entries:
+        try:
+            if entry.name.endswith(".pdf") and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass  # Ingested and removed meanwhile.
+    return removed
+
+async def sweep_ingest_forever(interval: float = INGEST_SWEEP_INTERVAL):
+    while True:
+        try:
+            removed = await asyncio.to_thread(sweep_ingest_dir)
+            if removed:
+                print(f"[INGEST] Removed {removed} abandoned uploads")
+        except Exception as e:
+            print(f"[INGEST][ERROR] Sweep failed: {e}")
+        await asyncio.sleep(interval)
+
+def _store_pdf(src, path: str):
+    with open(path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+
+# Parsed readers kept in each pool process, so the jobs of one ingest do not re-parse the whole file every few pages.
+_readers: "OrderedDict[tuple, PyPDF2.PdfReader]" = OrderedDict()
+READER_CACHE_SIZE = 2
+
+def _reader(path: str) -> PyPDF2.PdfReader:
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    reader = _readers.get(key)
+    if reader is None:
+        reader = _readers[key] = PyPDF2.PdfReader(path)
+        while len(_readers) > READER_CACHE_SIZE:
+            _readers.popitem(last=False)
+    else:
+        _readers.move_to_end(key)
+    return reader
+
+def _page_count(path: str) -> int:
+    return len(_reader(path).pages)
+
+def _extract_pages(path: str, start: int, count: int) -> list:
+    pages = _reader(path).pages
+    return [(pages[i].extract_text() or "") + "\n" for i in range(start, min(start + count, len(pages)))]
+
+async def iter_pdf_pages(path: str, prefetch: int = 4, pages: Optional[int] = None):
+    """Yield page text extracted in the process pool, `prefetch` pages per job and one job ahead of the consumer.
+    `pages` is the count reported at upload, if known; otherwise it is read from the file."""
+    total = pages if isinstance(pages, int) and pages > 0 else await processes.run(_page_count, path)
+    starts = iter(range(0, total, prefetch))
+    def submit():
+        start = next(starts, None)
+        return None if start is None else asyncio.ensure_future(processes.run(_extract_pages, path, start, prefetch))
+    job = submit()
+    try:
+        while job is not None:
+            pages = await job
+            job = submit()
+            for text in pages:
+                yield text
+    finally:
+        if job is not None:
+            job.cancel()
+            await asyncio.gather(job, return_exceptions=True)
+
 async def handle_file_upload(file: UploadFile):
     extension = file.filename.split(".")[-1].lower()
     
     if extension in ["jpg", "jpeg", "png", "webp", "gif"]:
         try:
-            upload_result = cloudinary.uploader.upload(file.file, folder="ai_chat_uploads")
+            upload_result = await threads.run(cloudinary.uploader.upload, file.file, folder="ai_chat_uploads")
             return {
                 "type": "image",
                 "url": upload_result["secure_url"],
                 "filename": file.filename,
                 "file_path": None
             }
+        except ExecutorBusy:
+            raise
         except Exception as e:
             return {"error": f"Cloud Upload Failed: {str(e)}"}
 
     elif extension == "pdf":
-        text_content = ""
+        # Only a handle goes back to the client; the text is extracted server-side at ingest time.
+        file_id = uuid.uuid4().hex
+        path = ingest_path(file_id)
         try:
-            pdf_reader = PyPDF2.PdfReader(file.file)
-            for page in pdf_reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_content += text + "\n"
+            os.makedirs(INGEST_DIR, exist_ok=True)
+            await threads.run(_store_pdf, file.file, path)
+            page_count = await processes.run(_page_count, path)
         except Exception as e:
+            if os.path.exists(path): os.remove(path)
+            if isinstance(e, ExecutorBusy): raise
             return {"error": f"PDF Read Error: {str(e)}"}
             
         return {
             "type": "text",
-            "content": text_content.strip(),
+            "file_id": file_id,
+            "pages": page_count,
             "filename": file.filename,
             "preview": f"PDF: {file.filename}"
         }
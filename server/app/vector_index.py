@@ -0,0 +1,226 @@
+import os
+import re
+import asyncio
+import numpy as np
+from time import monotonic
+from typing import Dict, List, Optional, Tuple
+from .ann import IVFPQIndex
+from .lexical import BM25Index
+
+VECTOR_INDEX_IDLE_SECONDS = float(os.getenv("VECTOR_INDEX_IDLE_SECONDS", 900))
+# Sessions at or above this many chunks get an IVF-PQ index; smaller ones stay exact.
+VECTOR_ANN_MIN_VECTORS = int(os.getenv("VECTOR_ANN_MIN_VECTORS", 20000))
+VECTOR_ANN_NLIST = int(os.getenv("VECTOR_ANN_NLIST", 0))  # 0 = ~4*sqrt(n)
+VECTOR_ANN_M = int(os.getenv("VECTOR_ANN_M", 48))
+VECTOR_ANN_NPROBE = int(os.getenv("VECTOR_ANN_NPROBE", 16))
+VECTOR_ANN_RERANK = int(os.getenv("VECTOR_ANN_RERANK", 8))  # ANN candidates re-scored exactly per result
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR")  # persist trained ANN indexes here when set
+
+def build_ann(vectors: np.ndarray) -> IVFPQIndex:
+    nlist = VECTOR_ANN_NLIST or int(min(4096, max(64, 4 * np.sqrt(len(vectors)))))
+    dim = vectors.shape[1]
+    m = VECTOR_ANN_M if dim % VECTOR_ANN_M == 0 else next(m for m in range(min(VECTOR_ANN_M, dim), 0, -1) if dim % m == 0)
+    ann = IVFPQIndex(dim, nlist=nlist, m=m, nprobe=VECTOR_ANN_NPROBE)
+    ann.train(vectors)
+    ann.add(vectors, np.arange(len(vectors)))
+    return ann
+
+class SessionIndex:
+    """Cosine search over one session's chunks: a row-normalised float32 matrix that grows
+    geometrically, scored with a single matmul per query -- or, once the session is large,
+    IVF-PQ candidates re-ranked exactly against that matrix."""
+
+    def __init__(self, lexical: bool = False):
+        self.doc_ids: List[str] = []
+        self.ids = set()
+        self.contents: List[str] = []
+        self.matrix = np.empty((0, 0), dtype=np.float32)
+        self.size = 0
+        self.last_used = monotonic()
+        self.ann: Optional[IVFPQIndex] = None
+        self.building = False
+        self.dirty = False
+        self.lexical = BM25Index() if lexical else None
+
+    def add(self, docs: List[dict]):
+        docs = [d for d in docs if d.get("embedding") and str(d["_id"]) not in self.ids]
+        if docs:
+            self.add_vectors(
+                np.asarray([d["embedding"] for d in docs], dtype=np.float32),
+                [str(d["_id"]) for d in docs],
+                [d["content"] for d in docs],
+            )
+
+    def add_vectors(self, vectors: np.ndarray, doc_ids: List[str], contents: List[str]):
+        vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        start, needed = self.size, self.size + len(vectors)
+        if self.matrix.shape[1] != vectors.shape[1]:
+            self.matrix = np.empty((0, vectors.shape[1]), dtype=np.float32)
+        if needed > self.matrix.shape[0]:
+            # A fresh array rather than an in-place resize, so a background ANN build can keep reading the old one.
+            grown = np.empty((max(needed, 2 * self.matrix.shape[0], 64), vectors.shape[1]), dtype=np.float32)
+            grown[:self.size] = self.matrix[:self.size]
+            self.matrix = grown
+        self.matrix[start:needed] = vectors
+        self.size = needed
+        self.contents.extend(contents)
+        if self.lexical is not None:
+            for content in contents:
+                self.lexical.add(content)
+        self.doc_ids.extend(doc_ids)
+        self.ids.update(doc_ids)
+        if self.ann is not None:
+            self.ann.add(vectors, np.arange(start, needed))
+            self.dirty = True
+
+    def search(self, query: List[float], top_k: int, nprobe: Optional[int] = None) -> List[Tuple[float, str]]:
+        self.last_used = monotonic()
+        if not self.size:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        q /= max(float(np.linalg.norm(q)), 1e-12)
+        if self.ann is not None:
+            candidates, _ = self.ann.search(q, top_k * VECTOR_ANN_RERANK, nprobe)
+            scores = self.matrix[candidates] @ q
+        else:
+            candidates = np.arange(self.size)
+            scores = self.matrix[:self.size] @ q
+        k = min(top_k, len(candidates))
+        if not k:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.contents[candidates[i]]) for i in top]
+
+    def lexical_search(self, query: str, top_k: int) -> List[Tuple[float, str]]:
+        self.last_used = monotonic()
+        if self.lexical is None:
+            return []
+        return [(score, self.contents[i]) for score, i in self.lexical.search(query, top_k)]
+
+    def attach_ann(self, ann: IVFPQIndex, trained_ids: List[str]) -> bool:
+        """Adopt a built or reloaded ANN index whose vector ids refer to `trained_ids`, then
+        insert whatever this session gained since. False if the index no longer matches."""
+        position = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+        if len(trained_ids) > self.size or any(d not in position for d in trained_ids):
+            return False
+        remap = np.fromiter((position[d] for d in trained_ids), dtype=np.int64, count=len(trained_ids))
+        for cell in range(ann.nlist):
+            n = ann.list_sizes[cell]
+            ann.list_ids[cell][:n] = remap[ann.list_ids[cell][:n]]
+        known = set(trained_ids)
+        missing = np.array([i for i, d in enumerate(self.doc_ids) if d not in known], dtype=np.int64)
+        if len(missing):
+            ann.add(self.matrix[missing], missing)
+        self.ann = ann
+        self.dirty = bool(len(missing))
+        return True
+
+    def snapshot(self) -> dict:
+        # Taken on the event loop so a concurrent insert cannot tear the arrays being written.
+        self.dirty = False
+        return dict(self.ann.to_arrays(), doc_ids=np.array(self.doc_ids[:self.ann.ntotal]))
+
+def _index_path(session_id: str) -> Optional[str]:
+    if not VECTOR_INDEX_DIR:
+        return None
+    return os.path.join(VECTOR_INDEX_DIR, re.sub(r"[^A-Za-z0-9_-]", "_", session_id) + ".npz")
+
+def _save_snapshot(path: str, arrays: dict):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, **arrays)
+
+def _load_saved(path: str):
+    with np.load(path) as data:
+        trained_ids = data["doc_ids"].tolist()
+    return IVFPQIndex.load(path), trained_ids
+
+class VectorIndexRegistry:
+    """Per-session in-memory indexes (plus BM25 when `lexical`), loaded lazily from `vector_storage` and evicted when idle."""
+
+    def __init__(self, collection, idle_seconds: float = VECTOR_INDEX_IDLE_SECONDS, lexical: bool = False):
+        self.collection = collection
+        self.lexical = lexical
+        self.idle_seconds = idle_seconds
+        self.indexes: Dict[str, SessionIndex] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+        self._background = set()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    def _evict_idle(self):
+        cutoff = monotonic() - self.idle_seconds
+        for session_id in [s for s, idx in self.indexes.items() if idx.last_used < cutoff and not idx.building]:
+            index = self.indexes.pop(session_id)
+            self.locks.pop(session_id, None)
+            path = _index_path(session_id)
+            if path and index.ann is not None and index.dirty:
+                self._spawn(asyncio.to_thread(_save_snapshot, path, index.snapshot()))
+
+    async def get(self, session_id: str) -> SessionIndex:
+        self._evict_idle()
+        lock = self.locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            index = self.indexes.get(session_id)
+            if index is None:
+                index = SessionIndex(lexical=self.lexical)
+                docs = await self.collection.find(
+                    {"session_id": session_id}, {"content": 1, "embedding": 1}
+                ).to_list(length=None)
+                index.add(docs)
+                await self._restore_ann(session_id, index)
+                self.indexes[session_id] = index
+            self._maybe_build(session_id, index)
+            return index
+
+    async def _restore_ann(self, session_id: str, index: SessionIndex):
+        path = _index_path(session_id)
+        if not path or index.size < VECTOR_ANN_MIN_VECTORS or not os.path.exists(path):
+            return
+        try:
+            ann, trained_ids = await asyncio.to_thread(_load_saved, path)
+            if not index.attach_ann(ann, trained_ids):
+                print(f"[VECTOR INDEX] Stale ANN index for {session_id}, rebuilding.")
+        except Exception as e:
+            print(f"[VECTOR INDEX ERROR] Loading {path}: {e}")
+
+    def _maybe_build(self, session_id: str, index: SessionIndex):
+        if index.ann is None and not index.building and index.size >= VECTOR_ANN_MIN_VECTORS:
+            index.building = True
+            self._spawn(self._build(session_id, index))
+
+    async def _build(self, session_id: str, index: SessionIndex):
+        try:
+            size = index.size
+            trained_ids = index.doc_ids[:size]
+            ann = await asyncio.to_thread(build_ann, index.matrix[:size])
+            index.attach_ann(ann, trained_ids)
+            path = _index_path(session_id)
+            if path:
+                await asyncio.to_thread(_save_snapshot, path, index.snapshot())
+        except Exception as e:
+            print(f"[VECTOR INDEX ERROR] ANN build for {session_id}: {e}")
+        finally:
+            index.building = False
+
+    async def add(self, session_id: str, docs: List[dict]):
+        # Only sessions already in memory need updating; others load fresh on next search.
+        lock = self.locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            index = self.indexes.get(session_id)
+            if index is not None:
+                index.add(docs)
+                self._maybe_build(session_id, index)
+
+    async def search(self, session_id: str, query: List[float], top_k: int = 5) -> List[Tuple[float, str]]:
+        return (await self.get(session_id)).search(query, top_k)
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self.indexes),
+            "vectors": sum(i.size for i in self.indexes.values()),
+            "ann_sessions": sum(i.ann is not None for i in self.indexes.values()),
+        }
@@ -0,0 +1,109 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+from collections import Counter, deque
+from datetime import datetime
+from typing import Optional
+import numpy as np
+from .metrics import Counter as MetricCounter, Histogram
+
+LOOP_WATCHDOG = os.getenv("LOOP_WATCHDOG", "false").lower() == "true"
+LOOP_WATCHDOG_INTERVAL_MS = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", 50))
+LOOP_WATCHDOG_THRESHOLD_MS = float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", 100))
+LOOP_WATCHDOG_KEEP = int(os.getenv("LOOP_WATCHDOG_KEEP", 50))
+STACK_LIMIT = 30
+
+lag_seconds = Histogram("event_loop_lag_seconds", "How late the event loop ran a timer that was due.",
+                        buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0))
+stalls_total = MetricCounter("event_loop_stalls_total", "Times a single callback held the event loop past the threshold.")
+
+class LoopWatchdog:
+    """Measures event-loop lag and catches whatever is blocking the loop.
+
+    A heartbeat task on the loop wakes every `interval_ms` and records how late it was.
+    A sampler thread watches that heartbeat. If no beat arrives within `threshold_ms` of
+    when one was due, a callback is holding the loop. The sampler then snapshots the
+    loop thread's stack on each tick until the loop recovers. The stall is logged and
+    kept (distinct stacks with sample counts) for /debug/loop.
+    """
+
+    def __init__(self, interval_ms: float = LOOP_WATCHDOG_INTERVAL_MS, threshold_ms: float = LOOP_WATCHDOG_THRESHOLD_MS,
+                 keep: int = LOOP_WATCHDOG_KEEP):
+        self.interval = interval_ms / 1000
+        self.threshold = threshold_ms / 1000
+        self.stalls = deque(maxlen=keep)
+        self.lags = deque(maxlen=2000)
+        self.beat = time.monotonic()
+        self.loop_thread: Optional[int] = None
+        self.heartbeat: Optional[asyncio.Task] = None
+        self.sampler: Optional[threading.Thread] = None
+        self.running = False
+
+    def start(self):
+        self.loop_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.running = True
+        self.heartbeat = asyncio.create_task(self._heartbeat())
+        self.sampler = threading.Thread(target=self._sample, name="loop-watchdog", daemon=True)
+        self.sampler.start()
+        print(f"[WATCHDOG] Watching the event loop (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        self.running = False
+        if self.heartbeat:
+            self.heartbeat.cancel()
+            await asyncio.gather(self.heartbeat, return_exceptions=True)
+        if self.sampler:
+            await asyncio.to_thread(self.sampler.join, 1)
+
+    async def _heartbeat(self):
+        while True:
+            due = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.beat = time.monotonic()
+            lag = max(self.beat - due, 0.0)
+            self.lags.append(lag)
+            lag_seconds.observe(lag)
+
+    def _sample(self):
+        stall_start, stacks = None, Counter()
+        while self.running:
+            time.sleep(self.interval / 2)
+            overdue = time.monotonic() - self.beat - self.interval
+            if overdue > self.threshold:
+                if stall_start is None:
+                    stall_start = self.beat + self.interval
+                frame = sys._current_frames().get(self.loop_thread)
+                if frame is not None:
+                    stacks["".join(traceback.format_stack(frame, limit=STACK_LIMIT))] += 1
+            elif stall_start is not None:
+                self._record(stall_start, stacks)
+                stall_start, stacks = None, Counter()
+
+    def _record(self, started: float, stacks: Counter):
+        blocked_ms = round((self.beat - started) * 1000, 1)
+        stall = {
+            "at": datetime.utcnow().isoformat(),
+            "blocked_ms": blocked_ms,
+            "samples": [{"count": n, "stack": stack} for stack, n in stacks.most_common(5)],
+        }
+        self.stalls.append(stall)
+        stalls_total.inc()
+        top = stall["samples"][0]["stack"].rstrip().splitlines()[-2:] if stall["samples"] else []
+        print(f"[WATCHDOG] Event loop blocked for {blocked_ms:.0f}ms at:\n" + "\n".join(top))
+
+    def stats(self) -> dict:
+        lags = np.asarray(self.lags) * 1000 if self.lags else None
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_p50_ms": round(float(np.percentile(lags, 50)), 2) if lags is not None else None,
+            "lag_p99_ms": round(float(np.percentile(lags, 99)), 2) if lags is not None else None,
+            "lag_max_ms": round(float(lags.max()), 2) if lags is not None else None,
+            "stalls": stalls_total.values.get((), 0),
+        }
+
+watchdog = LoopWatchdog()
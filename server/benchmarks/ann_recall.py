@@ -0,0 +1,59 @@
+"""Recall vs latency of the IVF-PQ session index against exact search on synthetic corpora.
+
+    cd server && python -m benchmarks.ann_recall --sizes 10000 100000 1000000 --nprobe 1 4 8 16 32 64 --rerank 8
+"""
+import argparse
+import time
+import numpy as np
+from app import vector_index
+from app.vector_index import SessionIndex, build_ann
+
+def synthetic_corpus(n: int, dim: int, clusters: int, rng) -> np.ndarray:
+    # Clustered like real chunk embeddings: documents share topics, chunks vary around them.
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    x = centers[rng.integers(0, clusters, size=n)] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def timed_search(index: SessionIndex, queries: np.ndarray, k: int, nprobe=None):
+    results, start = [], time.perf_counter()
+    for q in queries:
+        results.append({c for _, c in index.search(q, k, nprobe)})
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+def run(n: int, args, rng):
+    corpus = synthetic_corpus(n, args.dim, max(16, n // 500), rng)
+    queries = corpus[rng.choice(n, size=args.queries, replace=False)] + 0.1 * rng.normal(size=(args.queries, args.dim)).astype(np.float32)
+
+    index = SessionIndex()
+    ids = [str(i) for i in range(n)]
+    index.add_vectors(corpus, ids, ids)
+    truth, exact_ms = timed_search(index, queries, args.k)
+    print(f"\nn={n:,}  exact: {exact_ms:.2f} ms/query")
+
+    start = time.perf_counter()
+    index.attach_ann(build_ann(index.matrix[:n]), ids)
+    print(f"  ivf-pq build: {time.perf_counter() - start:.1f} s  (nlist={index.ann.nlist}, m={index.ann.m})")
+
+    print(f"  {'nprobe':>6} {'recall@' + str(args.k):>10} {'ms/query':>9} {'speedup':>8}")
+    for nprobe in args.nprobe:
+        found, ann_ms = timed_search(index, queries, args.k, nprobe)
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth)])
+        print(f"  {nprobe:>6} {recall:>10.3f} {ann_ms:>9.2f} {exact_ms / ann_ms:>7.1f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--rerank", type=int, default=vector_index.VECTOR_ANN_RERANK, help="ANN candidates re-scored exactly per result")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    vector_index.VECTOR_ANN_RERANK = args.rerank
+    rng = np.random.default_rng(args.seed)
+    for n in args.sizes:
+        run(n, args, rng)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Offline accuracy and latency of the local intent classifier (rules + hashed n-gram logistic regression).
+
+    cd server && python -m benchmarks.intent                         # k-fold over app/data/intent_examples.tsv
+    cd server && python -m benchmarks.intent --file more.tsv         # add your own labelled examples (LABEL<TAB>text)
+    cd server && python -m benchmarks.intent --save intent_model.npz # train on everything; load with INTENT_MODEL_PATH
+
+Accuracy is measured on held-out folds, both with the model alone and with the rules in
+front of it. The folds only hold out examples from the model; the rules were written with
+intent_examples.tsv in view. app/data/intent_holdout.tsv was written before the rules were
+last changed and is never trained or tuned on; it is scored separately with a model trained
+on every example. "fallback" is the share of messages below INTENT_CONFIDENCE (INTENT_IMAGE_CONFIDENCE
+for IMAGE), which detect_intent would send to the LLM. It also reports how accurate the confident rest is.
+"""
+import argparse
+import time
+import numpy as np
+from app.intent import INTENT_CONFIDENCE, INTENT_HOLDOUT, LABELS, IntentClassifier, confident, load_examples, rules
+
+def cross_validate(texts, labels, folds: int, threshold: float, seed: int):
+    order = np.random.default_rng(seed).permutation(len(texts))
+    predicted, confidence, rule_hit = [None] * len(texts), np.zeros(len(texts)), np.zeros(len(texts), dtype=bool)
+    model_only = [None] * len(texts)
+    for fold in range(folds):
+        test = order[fold::folds]
+        train = np.setdiff1d(order, test)
+        model = IntentClassifier().fit([texts[i] for i in train], [labels[i] for i in train])
+        for i in test:
+            label, conf = model.predict(texts[i])
+            model_only[i] = label
+            ruled = rules(texts[i])
+            rule_hit[i] = ruled is not None
+            predicted[i], confidence[i] = (ruled, 1.0) if ruled else (label, conf)
+
+    print(f"{len(texts)} examples, {folds}-fold cross-validation\n")
+    summarize(texts, labels, predicted, model_only, confidence, rule_hit, threshold)
+
+def score_holdout(texts, labels, path: str, threshold: float):
+    model = IntentClassifier().fit(texts, labels)
+    held_texts, held_labels = load_examples(path)
+    predicted, model_only, confidence, rule_hit = [], [], [], []
+    for text in held_texts:
+        label, conf = model.predict(text)
+        ruled = rules(text)
+        model_only.append(label)
+        rule_hit.append(ruled is not None)
+        predicted.append(ruled or label)
+        confidence.append(1.0 if ruled else conf)
+    print(f"\n{len(held_texts)} held-out examples from {path}\n")
+    summarize(held_texts, held_labels, np.array(predicted), np.array(model_only), np.array(confidence),
+              np.array(rule_hit), threshold)
+
+def summarize(texts, labels, predicted, model_only, confidence, rule_hit, threshold: float):
+    truth = np.array(labels)
+    predicted, model_only = np.array(predicted), np.array(model_only)
+    trusted = np.array([confident(p, c, threshold) for p, c in zip(predicted, confidence)])
+    # What actually costs a Horde job: an IMAGE label acted on without asking the LLM.
+    false_image = trusted & (predicted == "IMAGE") & (truth != "IMAGE")
+    print(f"model only accuracy     {np.mean(model_only == truth):.3f}")
+    print(f"rules + model accuracy  {np.mean(predicted == truth):.3f}")
+    print(f"rule matches            {rule_hit.mean():.1%} (accuracy {np.mean(predicted[rule_hit] == truth[rule_hit]):.3f})")
+    print(f"fallback to LLM         {1 - trusted.mean():.1%} below confidence {threshold}")
+    print(f"accuracy when confident {np.mean(predicted[trusted] == truth[trusted]):.3f}")
+    print(f"confident false IMAGE   {int(false_image.sum())}\n")
+
+    print("confusion (rows = truth)")
+    print(" " * 8 + "".join(f"{l:>9}" for l in LABELS))
+    for t in LABELS:
+        print(f"{t:>8}" + "".join(f"{np.sum((truth == t) & (predicted == p)):>9}" for p in LABELS))
+    wrong = [(texts[i], labels[i], predicted[i]) for i in range(len(texts)) if predicted[i] != labels[i]]
+    if wrong:
+        print("\nmisclassified")
+        for text, t, p in wrong[:15]:
+            print(f"  {t:>7} -> {p:<7} {text}")
+
+def latency(texts, repeats: int):
+    model = IntentClassifier()
+    start = time.perf_counter()
+    model.fit(*load_examples())
+    train_ms = (time.perf_counter() - start) * 1000
+    samples = []
+    for _ in range(repeats):
+        for text in texts:
+            start = time.perf_counter()
+            if not rules(text):
+                model.predict(text)
+            samples.append(time.perf_counter() - start)
+    us = np.array(samples) * 1e6
+    print(f"\ntraining {train_ms:.0f} ms; classify p50 {np.percentile(us, 50):.0f} us, "
+          f"p99 {np.percentile(us, 99):.0f} us over {len(us):,} calls")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", nargs="*", default=[])
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--holdout", default=INTENT_HOLDOUT, help="labelled examples scored but never trained on")
+    parser.add_argument("--threshold", type=float, default=INTENT_CONFIDENCE)
+    parser.add_argument("--repeats", type=int, default=20, help="latency passes over the examples")
+    parser.add_argument("--save", help="train on all examples and write the weights here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts, labels = load_examples()
+    for path in args.file:
+        more_texts, more_labels = load_examples(path)
+        texts += more_texts
+        labels += more_labels
+
+    cross_validate(texts, labels, args.folds, args.threshold, args.seed)
+    if args.holdout:
+        score_holdout(texts, labels, args.holdout, args.threshold)
+    latency(texts, args.repeats)
+    if args.save:
+        IntentClassifier().fit(texts, labels).save(args.save)
+        print(f"\nsaved weights to {args.save}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+"""Offline load test: boots main.py against local fakes and drives N concurrent WebSocket clients.
+
+    cd server && python -m benchmarks.loadtest --clients 50 --turns 5                # needs a local mongod
+    cd server && python -m benchmarks.loadtest --mongo mock                          # pip install mongomock-motor
+    cd server && python -m benchmarks.loadtest --ttft-ms 400 --tokens-per-sec 60 --fail-rate 0.2
+    cd server && python -m benchmarks.loadtest --docs 30 --mix complex=1             # RAG on every turn
+
+Nothing leaves the machine:
+- Gemini, Groq and Mistral become FakeProvider, with configurable first-token latency,
+  token rate, reply length and failure injection.
+- Embeddings come from a hashing backend with a configurable delay.
+- Serper and DuckDuckGo return canned results after --search-ms.
+- AI Horde is an httpx mock that finishes each job after --image-ms.
+
+The server runs on its own event loop in a background thread, so the lag probe measures
+the server's loop and not the clients'. The report covers:
+- client-side TTFT and turn latency (p50/p95/p99/max); image turns count until the picture arrives
+- throughput
+- server event-loop lag
+- the server's own chat_stage_seconds and provider histograms, for comparison
+
+Everything is written to the databases named in the app, so --mongo-uri must point at a
+throwaway local mongod. Benchmark sessions and the benchmark user are deleted afterwards.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+import numpy as np
+
+BENCH_EMAIL = "loadtest@example.com"
+SESSION_PREFIX = "loadtest-"
+PROMPTS = {
+    "simple": ["hi", "hello there", "thanks, bye", "good morning"],
+    "complex": [
+        "Explain how {topic} works and compare it with the alternatives",
+        "What are the trade-offs of {topic} in a production system?",
+        "Summarise the key points of {topic} from my documents",
+    ],
+    "image": ["draw a picture of a {topic}", "generate an image of a {topic} at sunset"],
+}
+TOPICS = ["consistent hashing", "vector search", "raft consensus", "bloom filters", "the TCP handshake",
+          "garbage collection", "B-tree indexes", "rate limiting", "lighthouse", "mountain cabin"]
+FILLER = ("Retrieval quality depends on chunking, on the embedding model and on how results are fused. "
+          "Indexes trade write cost for read latency, and caches trade memory for repeated work. ")
+
+def configure_env(args):
+    # The app reads its configuration at import time, so this has to run before anything under app/ is imported.
+    os.environ.update({
+        "MONGO_URI": args.mongo_uri,
+        "VECTOR_SEARCH_BACKEND": "local",
+        "RESPONSE_CACHE": str(args.response_cache).lower(),
+    })
+    for key, value in {"GROQ_API_KEY": "fake", "MISTRAL_API_KEY": "fake", "GOOGLE_API_KEY": "fake",
+                       "MAIL_USERNAME": "fake", "MAIL_PASSWORD": "fake", "MAIL_FROM": "loadtest@example.com"}.items():
+        os.environ.setdefault(key, value)
+    if args.mongo == "mock":
+        import motor.motor_asyncio
+        from mongomock_motor import AsyncMongoMockClient
+        motor.motor_asyncio.AsyncIOMotorClient = AsyncMongoMockClient
+        # pymongo passes `sort=` to every bulk update; mongomock's builder does not take it yet.
+        from mongomock.collection import BulkOperationBuilder
+        add_update = BulkOperationBuilder.add_update
+
+        def add_update_without_sort(self, *a, sort=None, **kw):
+            if sort is not None:
+                raise NotImplementedError("mongomock cannot sort a bulk update")
+            return add_update(self, *a, **kw)
+        BulkOperationBuilder.add_update = add_update_without_sort
+
+def make_fakes(args):
+    from app.providers import Provider
+    from app.embeddings import EmbeddingBackend
+
+    rng = random.Random(args.seed)
+
+    def jitter(ms: float) -> float:
+        return max(rng.gauss(ms, ms * args.jitter), 0) / 1000
+
+    class FakeProvider(Provider):
+        """Streams `--reply-tokens` words at `--tokens-per-sec` after `--ttft-ms`; fails `--fail-rate` of requests."""
+
+        def __init__(self, real: Provider):
+            super().__init__(real.model, real.system_prompt)
+            self.name = real.name
+
+        async def stream(self, prompt, history, context=None):
+            await asyncio.sleep(jitter(args.ttft_ms))
+            if rng.random() < args.fail_rate:
+                raise RuntimeError(f"injected {self.name} failure")
+            per_chunk = args.chunk_tokens / args.tokens_per_sec
+            for i in range(0, args.reply_tokens, args.chunk_tokens):
+                yield " ".join(f"tok{j}" for j in range(i, min(i + args.chunk_tokens, args.reply_tokens))) + " "
+                await asyncio.sleep(per_chunk)
+
+        async def complete(self, prompt, max_tokens=None, temperature=None):
+            await asyncio.sleep(jitter(args.ttft_ms))
+            if rng.random() < args.fail_rate:
+                raise RuntimeError(f"injected {self.name} failure")
+            return "COMPLEX" if "ONE word" in prompt else "Load test title"
+
+    class FakeEmbeddings(EmbeddingBackend):
+        """Deterministic bag-of-words hashing into 384 dimensions, after `--embed-ms`."""
+        model_id = "loadtest/hashing-384"
+
+        async def embed(self, texts):
+            await asyncio.sleep(jitter(args.embed_ms))
+            vectors = np.zeros((len(texts), 384), dtype=np.float32)
+            for row, text in enumerate(texts):
+                for word in text.lower().split():
+                    vectors[row, int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % 384] += 1
+            vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+            return vectors.tolist()
+
+    async def fake_search(query: str):
+        await asyncio.sleep(jitter(args.search_ms))
+        return f"- Result for {query}: {FILLER[:160]} (Source: https://example.com)"
+
+    started = {}
+
+    async def fake_horde(request):
+        import httpx
+        path = request.url.path
+        if request.method == "POST":
+            job_id = f"job{len(started)}"
+            started[job_id] = time.monotonic()
+            return httpx.Response(202, json={"id": job_id})
+        job_id = path.rsplit("/", 1)[-1]
+        done = time.monotonic() - started.get(job_id, 0) >= args.image_ms / 1000
+        if request.method == "DELETE" or "/generate/status/" in path:
+            return httpx.Response(200, json={"done": done, "generations": [{"img": f"https://example.com/{job_id}.webp"}]})
+        return httpx.Response(200, json={"done": done, "wait_time": 1, "queue_position": 0})
+
+    return FakeProvider, FakeEmbeddings, fake_search, fake_horde
+
+def install_fakes(args):
+    import httpx
+    from app import chat, embeddings, tools
+    FakeProvider, FakeEmbeddings, fake_search, fake_horde = make_fakes(args)
+    for attr in ("gemini_llm", "groq_llm", "mistral_llm", "title_llm", "fast_llm"):
+        setattr(chat, attr, FakeProvider(getattr(chat, attr)))
+    embeddings._backend = FakeEmbeddings()
+    tools.search_google_serper = fake_search
+    tools.search_ddg_async = fake_search
+    tools._client = httpx.AsyncClient(transport=httpx.MockTransport(fake_horde))
+
+class ServerThread(threading.Thread):
+    """Runs uvicorn on a private event loop and exposes that loop for seeding and lag probes."""
+
+    def __init__(self, app, port: int):
+        super().__init__(daemon=True)
+        import uvicorn
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws_max_size=2 ** 24))
+        self.loop = asyncio.new_event_loop()
+        self.lag = []
+        self.probing = True
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def call(self, coro, timeout: float = 120):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    async def probe(self, interval: float):
+        while self.probing:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            self.lag.append(time.perf_counter() - start - interval)
+
+    def stop(self):
+        self.probing = False
+        self.server.should_exit = True
+        self.join(timeout=30)
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+async def seed(args, sessions):
+    from app.models import ChatSession, User
+    from app.rag import add_to_vector_db
+    if not await User.find_one(User.email == BENCH_EMAIL):
+        await User(email=BENCH_EMAIL, hashed_password="x", is_verified=True).insert()
+    for session_id in sessions:
+        await ChatSession(session_id=session_id, user_email=BENCH_EMAIL, title="Load test").insert()
+        if args.docs:
+            text = "\n\n".join(f"Section {i} on {TOPICS[i % len(TOPICS)]}. {FILLER * 3}" for i in range(args.docs))
+            await add_to_vector_db(text, "loadtest.pdf", session_id)
+
+async def cleanup(sessions):
+    from app.models import ChatMessage, ChatSession, User
+    from app.persistence import persistence
+    from app.rag import vector_collection
+    await persistence.flush()
+    await ChatMessage.find({"session_id": {"$in": sessions}}).delete()
+    await ChatSession.find({"session_id": {"$in": sessions}}).delete()
+    await vector_collection.delete_many({"session_id": {"$in": sessions}})
+    await User.find(User.email == BENCH_EMAIL).delete()
+
+def parse_mix(mix: str):
+    weights = {k: float(v) for k, _, v in (item.partition("=") for item in mix.split(",")) if k}
+    unknown = set(weights) - set(PROMPTS)
+    if unknown:
+        raise SystemExit(f"unknown prompt kinds in --mix: {sorted(unknown)}")
+    return list(weights), list(weights.values())
+
+async def run_client(index: int, args, url: str, token: str, session_id: str, results: list):
+    import websockets
+    rng = random.Random(args.seed * 1000 + index)
+    kinds, weights = parse_mix(args.mix)
+    await asyncio.sleep(args.ramp * index / max(args.clients, 1))
+    async with websockets.connect(f"{url}/api/chat/ws/{session_id}?token={token}&compact=true", max_size=None) as ws:
+        for turn in range(args.turns):
+            kind = rng.choices(kinds, weights)[0]
+            prompt = rng.choice(PROMPTS[kind]).format(topic=rng.choice(TOPICS))
+            if not args.repeat_prompts:
+                prompt += f" (client {index}, turn {turn})"
+            sent = time.perf_counter()
+            await ws.send(json.dumps({"type": "message", "message": prompt, "tempId": f"{index}-{turn}"}))
+            # An image turn ends before the picture exists, so it is timed until its "image" frame arrives.
+            first, text, end, image = None, [], None, None
+            while end is None or image is not None:
+                frame = await ws.recv()
+                if isinstance(frame, bytes):
+                    first = first or time.perf_counter()
+                    text.append(frame.decode())
+                    continue
+                data = json.loads(frame)
+                if data["type"] == "chunk" and data.get("content"):
+                    first = first or time.perf_counter()
+                    text.append(data["content"])
+                elif data["type"] == "image_pending":
+                    image = data["id"]
+                elif data["type"] == "image" and data["id"] == image:
+                    first, image = time.perf_counter(), None
+                    text.append(data["content"])
+                elif data["type"] == "end":
+                    end = data
+            done = time.perf_counter()
+            results.append({
+                "kind": kind, "ttft": first - sent if first else None, "total": done - sent,
+                "chars": sum(map(len, text)), "capacity": "".join(text).startswith("All AI systems"),
+                "trace": end.get("trace"),
+            })
+            if args.think_ms:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+def percentiles(label: str, samples, scale: float = 1000.0):
+    if not len(samples):
+        print(f"{label:>22} {'-':>9}")
+        return
+    values = np.asarray(samples) * scale
+    print(f"{label:>22} {len(values):>7} {np.percentile(values, 50):>9.1f} {np.percentile(values, 95):>9.1f} "
+          f"{np.percentile(values, 99):>9.1f} {values.max():>9.1f}")
+
+def server_histograms():
+    from app import metrics
+    print(f"\n{'server histogram':>40} {'count':>7} {'mean ms':>9}")
+    for histogram in (metrics.stage_seconds, metrics.ttft_seconds, metrics.generation_seconds,
+                      metrics.embedding_seconds, metrics.vector_search_seconds, metrics.web_search_seconds,
+                      metrics.cache_embed_wait_seconds, metrics.db_seconds):
+        for key, (_, total, count) in sorted(histogram.series.items()):
+            name = f"{histogram.name}{{{','.join(key)}}}"
+            print(f"{name:>40} {count:>7} {total / count * 1000:>9.1f}")
+    errors = dict(metrics.errors_total.values)
+    if errors:
+        print(f"\nhandled errors: { {k[0]: int(v) for k, v in errors.items()} }")
+
+def report(args, results, lag, elapsed: float):
+    turns = len(results)
+    chars = sum(r["chars"] for r in results)
+    capacity = sum(r["capacity"] for r in results)
+    print(f"\n{args.clients} clients x {args.turns} turns: {turns} turns in {elapsed:.1f}s, "
+          f"{turns / elapsed:.1f} turns/s, {chars / elapsed / 1000:.1f}k chars/s streamed, "
+          f"{capacity} capacity replies\n")
+    print(f"{'':>22} {'n':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    percentiles("ttft", [r["ttft"] for r in results if r["ttft"] is not None])
+    by_kind = defaultdict(list)
+    for r in results:
+        if r["ttft"] is not None:
+            by_kind[r["kind"]].append(r["ttft"])
+    for kind, samples in sorted(by_kind.items()):
+        percentiles(f"ttft ({kind})", samples)
+    percentiles("turn", [r["total"] for r in results])
+    percentiles("server loop lag", lag)
+    server_histograms()
+    if args.response_cache:
+        from app.chat import response_cache
+        print(f"\nresponse cache: {response_cache.stats()}")
+    slowest = max(results, key=lambda r: r["total"], default=None)
+    if slowest and slowest["trace"]:
+        print(f"\nslowest turn: {slowest['total'] * 1000:.0f}ms, trace {slowest['trace']} (GET /traces/{slowest['trace']})")
+
+async def drive(args, url: str, token: str, sessions):
+    results = []
+    start = time.perf_counter()
+    outcomes = await asyncio.gather(*(run_client(i, args, url, token, sid, results) for i, sid in enumerate(sessions)),
+                                    return_exceptions=True)
+    failed = [o for o in outcomes if isinstance(o, Exception)]
+    if failed:
+        print(f"{len(failed)} clients failed, first: {failed[0]!r}")
+    return results, time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=5, help="messages per client, sent one after another")
+    parser.add_argument("--ramp", type=float, default=1.0, help="seconds over which clients connect")
+    parser.add_argument("--think-ms", type=float, default=0, help="mean pause between a client's turns")
+    parser.add_argument("--mix", default="simple=0.3,complex=0.7", help="prompt kinds and weights: simple, complex, image")
+    parser.add_argument("--repeat-prompts", action="store_true", help="reuse prompts verbatim so caches can hit")
+    parser.add_argument("--docs", type=int, default=0, help="document sections ingested into every session")
+    parser.add_argument("--ttft-ms", type=float, default=300)
+    parser.add_argument("--tokens-per-sec", type=float, default=80)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--chunk-tokens", type=int, default=4, help="tokens per streamed provider chunk")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of provider calls that fail before the first token")
+    parser.add_argument("--jitter", type=float, default=0.2, help="relative standard deviation of every fake latency")
+    parser.add_argument("--embed-ms", type=float, default=30)
+    parser.add_argument("--search-ms", type=float, default=400)
+    parser.add_argument("--image-ms", type=float, default=3000)
+    parser.add_argument("--response-cache", action="store_true")
+    parser.add_argument("--mongo", choices=["local", "mock"], default="local")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--lag-interval-ms", type=float, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.mongo == "local" and urlparse(args.mongo_uri).hostname not in ("localhost", "127.0.0.1"):
+        raise SystemExit("refusing to load-test a non-local MongoDB; the app writes to fixed database names")
+    configure_env(args)
+    import main as server_main
+    from app.auth import create_access_token
+    install_fakes(args)
+
+    port = free_port()
+    server = ServerThread(server_main.app, port)
+    server.start()
+    while not server.server.started:
+        if not server.is_alive():
+            raise SystemExit("server failed to start")
+        time.sleep(0.05)
+
+    run_id = f"{SESSION_PREFIX}{int(time.time())}-"
+    sessions = [f"{run_id}{i}" for i in range(args.clients)]
+    try:
+        print(f"seeding {len(sessions)} sessions" + (f" with {args.docs} document sections each" if args.docs else ""))
+        server.call(seed(args, sessions), timeout=600)
+        asyncio.run_coroutine_threadsafe(server.probe(args.lag_interval_ms / 1000), server.loop)
+        token = create_access_token({"sub": BENCH_EMAIL})
+        results, elapsed = asyncio.run(drive(args, f"ws://127.0.0.1:{port}", token, sessions))
+        report(args, results, server.lag, elapsed)
+    finally:
+        server.probing = False
+        try:
+            server.call(cleanup(sessions))
+        except Exception as e:
+            print(f"cleanup failed: {e}")
+        server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Seeds a throwaway database with millions of chat messages and times the hot queries with and without indexes.
+
+    cd server && python -m benchmarks.mongo_indexes --uri mongodb://localhost:27017
+    cd server && python -m benchmarks.mongo_indexes --uri ... --messages 5000000 --sessions 50000
+    cd server && python -m benchmarks.mongo_indexes --uri ... --skip-seed   # reuse the data from a previous run
+
+It writes to --db (default ai_chatbot_bench), never to the application database. Each
+query runs --runs times with random keys. The table shows median latency and the
+documents examined per query (from explain executionStats): first without the
+declared indexes, then after creating them.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.database import plan_stages
+from app.models import ChatMessage, ChatSession, User
+
+APP_DATABASES = {"ai_chatbot_db", "ai_chat_db"}
+
+async def seed(db, args):
+    for name in ("chat_messages", "chat_sessions", "users", "vector_storage"):
+        await db.drop_collection(name)
+    rng = random.Random(args.seed)
+    start_time = datetime(2025, 1, 1)
+    users = [f"user{i}@example.com" for i in range(args.users)]
+    await db.users.insert_many([{"email": u, "hashed_password": "x", "is_active": True, "is_verified": True} for u in users])
+    sessions = [(f"s{i:08d}", users[i % len(users)]) for i in range(args.sessions)]
+    await db.chat_sessions.insert_many([
+        {"session_id": sid, "user_email": email, "title": "Seeded", "created_at": start_time,
+         "updated_at": start_time + timedelta(seconds=rng.randrange(10 ** 7))}
+        for sid, email in sessions
+    ])
+
+    written, began = 0, time.perf_counter()
+    semaphore = asyncio.Semaphore(4)
+
+    async def insert(batch):
+        nonlocal written
+        async with semaphore:
+            await db.chat_messages.insert_many(batch, ordered=False)
+            written += len(batch)
+            if written % (args.batch * 20) < args.batch:
+                print(f"  {written:,} messages ({written / (time.perf_counter() - began):,.0f}/s)")
+
+    pending, batch = [], []
+    for i in range(args.messages):
+        sid, email = sessions[rng.randrange(len(sessions))]
+        batch.append({"session_id": sid, "user_email": email, "role": "user" if i % 2 == 0 else "assistant",
+                      "content": f"message {i}", "timestamp": start_time + timedelta(seconds=i), "attachments": []})
+        if len(batch) == args.batch:
+            pending.append(asyncio.create_task(insert(batch)))
+            batch = []
+            if len(pending) > 8:
+                await asyncio.gather(*pending)
+                pending = []
+    if batch:
+        pending.append(asyncio.create_task(insert(batch)))
+    await asyncio.gather(*pending)
+    await db.vector_storage.insert_many([
+        {"session_id": sessions[i % len(sessions)][0], "content": "chunk", "embedding": [0.0] * 8}
+        for i in range(min(args.messages // 10, 200_000))
+    ])
+    print(f"seeded {args.messages:,} messages, {args.sessions:,} sessions, {args.users:,} users "
+          f"in {time.perf_counter() - began:.1f}s\n")
+
+def queries(db, sessions, users):
+    return [
+        ("message history", db.chat_messages, lambda: {"session_id": random.choice(sessions)}, [("timestamp", -1)], 12),
+        ("session lookup", db.chat_sessions, lambda: {"session_id": random.choice(sessions)}, None, 1),
+        ("session list", db.chat_sessions, lambda: {"user_email": random.choice(users)}, [("updated_at", -1)], 0),
+        ("user lookup", db.users, lambda: {"email": random.choice(users)}, None, 1),
+        ("session chunks", db.vector_storage, lambda: {"session_id": random.choice(sessions)}, None, 0),
+    ]
+
+async def measure(db, args, label):
+    sessions = await db.chat_sessions.distinct("session_id")
+    users = await db.users.distinct("email")
+    print(label)
+    print(f"{'query':>16} {'median ms':>10} {'p95 ms':>8} {'docs examined':>14}  plan")
+    for name, collection, make_query, sort, limit in queries(db, sessions, users):
+        samples = []
+        for _ in range(args.runs):
+            cursor = collection.find(make_query())
+            if sort:
+                cursor = cursor.sort(sort)
+            if limit:
+                cursor = cursor.limit(limit)
+            start = time.perf_counter()
+            await cursor.to_list(length=None)
+            samples.append((time.perf_counter() - start) * 1000)
+        command = {"find": collection.name, "filter": make_query()}
+        if sort:
+            command["sort"] = dict(sort)
+        if limit:
+            command["limit"] = limit
+        stats = await db.command("explain", command, verbosity="executionStats")
+        examined = stats["executionStats"]["totalDocsExamined"]
+        stages = sorted(plan_stages(stats["queryPlanner"]["winningPlan"]))
+        print(f"{name:>16} {np.median(samples):>10.2f} {np.percentile(samples, 95):>8.2f} {examined:>14,}  {'+'.join(stages)}")
+    print()
+
+async def create_indexes(db):
+    for model, collection in ((ChatMessage, db.chat_messages), (ChatSession, db.chat_sessions), (User, db.users)):
+        await collection.create_indexes(model.Settings.indexes)
+    await db.vector_storage.create_index([("session_id", 1)], name="session_id")
+
+async def main(args):
+    if args.db in APP_DATABASES:
+        raise SystemExit(f"refusing to seed the application database {args.db!r}")
+    db = AsyncIOMotorClient(args.uri)[args.db]
+    if not args.skip_seed:
+        await seed(db, args)
+    for collection in ("chat_messages", "chat_sessions", "users", "vector_storage"):
+        await db[collection].drop_indexes()
+    await measure(db, args, "without indexes")
+    start = time.perf_counter()
+    await create_indexes(db)
+    print(f"built indexes in {time.perf_counter() - start:.1f}s\n")
+    await measure(db, args, "with indexes")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default="ai_chatbot_bench")
+    parser.add_argument("--messages", type=int, default=2_000_000)
+    parser.add_argument("--sessions", type=int, default=20_000)
+    parser.add_argument("--users", type=int, default=2_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--skip-seed", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(main(parser.parse_args()))
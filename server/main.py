@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request, Response
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.staticfiles import StaticFiles
@@ -6,6 +6,7 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 import os
 import shutil
+import asyncio
 
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -16,6 +17,18 @@ load_dotenv()
 
 from app.database import init_db
 from app import auth, chat
+from app.providers import close_providers
+from app.embeddings import close_backend
+from app.rag import embedding_cache, vector_index
+from app.tools import close_tools, search_cache
+from app.intent import INTENT_CLASSIFIER, get_classifier
+from app.persistence import persistence
+from app.metrics import render_metrics
+from app import tracing
+from app.watchdog import LOOP_WATCHDOG, watchdog
+from app.images import image_jobs
+from app.executors import executor_stats, shutdown_executors
+from app.utils import sweep_ingest_forever
 
 limiter = Limiter(key_func=get_remote_address)
 
@@ -24,9 +37,24 @@ if not os.path.exists("temp_uploads"):
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    if LOOP_WATCHDOG:
+        watchdog.start()
     await init_db()
     print("Database initialized.")
+    if INTENT_CLASSIFIER == "local":
+        await asyncio.to_thread(get_classifier)
+    sweeper = asyncio.create_task(sweep_ingest_forever())
     yield
+    sweeper.cancel()
+    await asyncio.gather(sweeper, return_exceptions=True)
+    await persistence.close()
+    if LOOP_WATCHDOG:
+        await watchdog.stop()
+    await close_providers()
+    await close_backend()
+    await image_jobs.close()
+    await close_tools()
+    shutdown_executors()
     if os.path.exists("temp_uploads"):
         shutil.rmtree("temp_uploads")
         print("Temporary uploads directory cleaned up.")
@@ -47,6 +75,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "HEAD"],
     allow_headers=["Authorization", "Content-Type"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.middleware("http")
@@ -71,6 +100,46 @@ async def home(request: Request):
 async def health_check():
     return {"status": "healthy", "timestamp": os.times()[4]}
 
+@app.get("/stats", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+async def cache_stats():
+    return {
+        "embedding_cache": embedding_cache.stats(),
+        "vector_index": vector_index.stats(),
+        "search_cache": search_cache.stats(),
+        "providers": chat.llm_router.stats(),
+        "persistence": persistence.stats(),
+        "auth_tokens": auth.token_cache.stats(),
+        "auth_users": auth.user_cache.stats(),
+        "executors": executor_stats(),
+        "images": image_jobs.stats(),
+        "event_loop": watchdog.stats() if LOOP_WATCHDOG else None,
+        "response_cache": chat.response_cache.stats() if chat.response_cache else None,
+    }
+
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+async def metrics():
+    return Response(content=render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/traces", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+async def recent_traces(limit: int = 50):
+    return [
+        {"trace_id": t.id, "total_ms": t.total_ms, **t.attrs, "spans": len(t.spans)}
+        for t in list(reversed(tracing.recent.values()))[:limit]
+    ]
+
+@app.get("/traces/{trace_id}", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+async def get_trace(trace_id: str):
+    trace = tracing.recent.get(trace_id)
+    if trace is None:
+        raise HTTPException(status_code=404, detail="Trace not found")
+    return trace.to_dict()
+
+@app.get("/debug/loop", include_in_schema=False, dependencies=[Depends(auth.require_admin)])
+async def loop_stalls(limit: int = 20):
+    if not LOOP_WATCHDOG:
+        raise HTTPException(status_code=404, detail="Set LOOP_WATCHDOG=true to enable the event loop watchdog")
+    return {**watchdog.stats(), "recent": list(reversed(watchdog.stalls))[:limit]}
+
 @app.get("/favicon.ico", include_in_schema=False)
 async def favicon():
     return Response(content="", media_type="image/x-icon")
\ No newline at end of file
@@ -0,0 +1,6 @@
+import os
+
+# app modules read their configuration at import time; give them harmless values so they import offline.
+for key, value in {"MONGO_URI": "mongodb://localhost:27017", "GROQ_API_KEY": "test", "MISTRAL_API_KEY": "test",
+                   "MAIL_USERNAME": "test", "MAIL_PASSWORD": "test", "MAIL_FROM": "test@example.com"}.items():
+    os.environ.setdefault(key, value)
@@ -0,0 +1,31 @@
+import os
+import time
+from time import monotonic
+import pytest
+from jose import jwt
+from app import auth
+
+@pytest.fixture
+def tokyo_time():
+    previous = os.environ.get("TZ")
+    os.environ["TZ"] = "Asia/Tokyo"
+    time.tzset()
+    yield
+    if previous is None:
+        del os.environ["TZ"]
+    else:
+        os.environ["TZ"] = previous
+    time.tzset()
+
+def test_token_cache_ttl_follows_exp_outside_utc(tokyo_time):
+    auth.token_cache.clear()
+    token = jwt.encode({"sub": "a@example.com", "exp": int(time.time()) + 5}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+    assert auth.decode_token(token) == "a@example.com"
+    _, expires, _ = auth.token_cache.entries[token]
+    assert expires - monotonic() <= 5
+
+def test_expired_token_is_not_cached(tokyo_time):
+    auth.token_cache.clear()
+    token = jwt.encode({"sub": "a@example.com", "exp": int(time.time()) - 1}, auth.SECRET_KEY, algorithm=auth.ALGORITHM)
+    assert auth.decode_token(token) is None
+    assert token not in auth.token_cache
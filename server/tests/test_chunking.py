@@ -0,0 +1,28 @@
+import random
+import pytest
+from app.chunking import TokenChunker, count_tokens
+
+def _document(seed: int) -> str:
+    rng = random.Random(seed)
+    words = ["vector", "index", "retrieval", "a", "of", "chunking", "embeddings", "latency", "https://example.com/" + "x" * 90]
+    paragraphs = []
+    for _ in range(40):
+        sentences = [" ".join(rng.choices(words, k=rng.randint(1, 40))) + "." for _ in range(rng.randint(1, 8))]
+        paragraphs.append(" ".join(sentences))
+    return "\n\n".join(paragraphs)
+
+@pytest.mark.parametrize("max_tokens,overlap", [(200, 32), (20, 8), (50, 25), (7, 3)])
+def test_chunks_never_exceed_max_tokens(max_tokens, overlap):
+    for seed in range(5):
+        text = _document(seed)
+        chunker = TokenChunker(max_tokens=max_tokens, overlap_tokens=overlap)
+        # Fed in uneven pieces, as pages arrive.
+        chunks = [c for i in range(0, len(text), 997) for c in chunker.feed(text[i:i + 997])] + list(chunker.finish())
+        assert chunks
+        assert max(count_tokens(c) for c in chunks) <= max_tokens
+
+def test_space_less_run_is_split():
+    chunker = TokenChunker(max_tokens=50, overlap_tokens=8)
+    chunks = list(chunker.feed("x" * 5000 + " tail.")) + list(chunker.finish())
+    assert all(count_tokens(c) <= 50 for c in chunks)
+    assert "".join(chunks).replace(" ", "").startswith("x" * 5000)
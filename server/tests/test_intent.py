@@ -0,0 +1,19 @@
+import pytest
+from app.intent import classify, confident, rules
+
+@pytest.mark.parametrize("text", [
+    "create a logo in svg code for my project",
+    "Can you make a picture frame size recommendation?",
+    "make a docker image for my app",
+    "make the image responsive in css",
+    "draw conclusions from this data",
+])
+def test_non_image_requests_never_go_to_horde_unchecked(text):
+    assert rules(text) is None
+    label, confidence = classify(text)
+    assert not (label == "IMAGE" and confident(label, confidence))
+
+@pytest.mark.parametrize("text", ["draw a cat wearing a space suit", "can you generate a photo of a rainy street",
+                                  "please make me a picture of a red panda"])
+def test_imperative_image_requests_match_the_rule(text):
+    assert rules(text) == "IMAGE"